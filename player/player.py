@@ -1,12 +1,16 @@
 import socket
 import json
+from collections import OrderedDict
 import time
 import threading
 from pynput import keyboard  # Use pynput for keyboard handling
 from player_logic import player_logic
+from protocol import (HELLO, hello_incomplete, ENCODING_BINARY, make_hello, parse_hello, encode_message,
+                      decode_datagram, FrameReader, JSONStreamReader, ProtocolError, MessageError)
 
 current_player = "player1"
 play_logic_flag = False
+udp_state_flag = False  # Take game state over UDP, TCP is then only used for commands
 
 # Sample server response for testing
 dummyserverResponse = {
@@ -37,49 +41,187 @@ class Player:
         return str(self.to_dict())
 
 class PlayerDataClient:
-    def __init__(self, server_host='127.0.0.1', server_port=65432):
+    def __init__(self, server_host='127.0.0.1', server_port=65432, encoding=ENCODING_BINARY, deltas=False):
         self.server_host = server_host
         self.server_port = server_port
         self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.requested_encoding = encoding  # None to talk the legacy unframed JSON protocol
+        self.encoding = None
+        self.reader = JSONStreamReader()
+        self.pending_data = b""  # Bytes received during the handshake that belong to the stream
+        self.send_lock = threading.Lock()
+        # Acknowledge snapshots so the server can send only changed fields. Deltas are JSON, so this
+        # only pays off without the binary encoding, whose full states are already smaller
+        self.deltas = deltas
+        self.snapshots = OrderedDict()  # Recent full states by snapshot id, bases for deltas
         self.server_response_data = {   
-            "player": {"id": "player1", "pos": (0, 0, 0, 0, 0, 0), "boost": False},
+            "player": {"id": "player1", "pos": (0, 0, 0, 0, 0, 0), "velocity": (0, 0, 0, 0, 0, 0), "boost": False},
             "target_pos": (0, 0, 0, 0, 0, 0),
-            "goal_pos": [(0, 0), (0, 0), (0, 0)]
+            "target_velocity": (0, 0, 0, 0, 0, 0),
+            "goal_pos": [(0, 0), (0, 0), (0, 0)],
+            "timestamp": None
         }
+        self.udp_socket = None
+        self.udp_seq = None  # Sequence number of the newest datagram applied
+        self.udp_stale = 0  # Datagrams dropped because a newer one had already arrived
 
     def connect(self):
         try:
             self.client_socket.connect((self.server_host, self.server_port))
             print(f"Connected to server at {self.server_host}:{self.server_port}")
+            if self.requested_encoding is not None:
+                self.negotiate()
         except ConnectionRefusedError:
             print(f"Failed to connect to server at {self.server_host}:{self.server_port}")
 
+    def negotiate(self, timeout=2.0):
+        """Ask the server for framed messages, falling back to JSON if it does not answer the hello."""
+        self.client_socket.sendall(make_hello(self.requested_encoding))
+        self.client_socket.settimeout(timeout)
+        data = b""
+        try:
+            while hello_incomplete(data):
+                chunk = self.client_socket.recv(1024)
+                if not chunk:
+                    break
+                data += chunk
+        except socket.timeout:
+            pass
+        finally:
+            self.client_socket.settimeout(None)
+
+        try:
+            _, self.encoding = parse_hello(data)
+            self.reader = FrameReader()
+            self.pending_data = data[HELLO.size:]
+            print(f"Using framed protocol with encoding {self.encoding}")
+        except ProtocolError:
+            # Old server, it answered the hello with a JSON error (or not at all)
+            self.encoding = None
+            print("Server does not support framing, using JSON")
+
     def send_data(self, data):
+        # Commands carry the capture timestamp of the latest state, for the server's latency tracing
+        timestamp = self.server_response_data.get("timestamp")
+        if "player_id" in data and timestamp is not None:
+            data = dict(data, trace=timestamp)
         try:
-            json_data = json.dumps(data)
-            self.client_socket.sendall(json_data.encode('utf-8'))
+            if self.encoding is None:
+                payload = json.dumps(data).encode('utf-8')
+            else:
+                payload = encode_message(data, self.encoding)
+            with self.send_lock:
+                self.client_socket.sendall(payload)
         except Exception as e:
             print(f"Error sending data: {e}")
 
     def receive_data(self):
         try:
+            response = self.pending_data
             while True:
-                response = self.client_socket.recv(1024)
                 if response:
                     try:
-                        self.server_response_data = json.loads(response.decode('utf-8'))
-                    except json.JSONDecodeError as e:
-                        print(f"Failed to decode JSON: {e}")
-                else:
+                        messages = self.reader.feed(response)
+                    except MessageError as e:
+                        print(f"Failed to decode message: {e}")
+                        messages = e.messages
+                    # Only the newest state matters
+                    for message in messages:
+                        if "error" in message:
+                            print(f"Server error: {message['error']}")
+                        else:
+                            self.apply_state(message)
+
+                response = self.client_socket.recv(4096)
+                if not response:
                     break
         except Exception as e:
             print(f"Error receiving data: {e}")
 
+    def apply_state(self, message, history=32):
+        """Rebuild the full state from a full or delta message and acknowledge its snapshot."""
+        if "delta" in message:
+            base = self.snapshots.get(message["base"])
+            if base is None:
+                print(f"Missing base snapshot {message['base']}")
+                return
+            state = dict(base, **message["delta"])
+        else:
+            state = {key: value for key, value in message.items() if key != "snapshot"}
+
+        snapshot = message.get("snapshot")
+        if snapshot is not None:
+            self.snapshots[snapshot] = state
+            while len(self.snapshots) > history:
+                self.snapshots.popitem(last=False)
+            if self.deltas and self.encoding != ENCODING_BINARY:
+                self.send_data({"ack": snapshot})
+
+        self.server_response_data = state
+
+    def subscribe_udp(self, player_id, port=0, multicast_group=None):
+        """
+        Receive game state as UDP datagrams instead of over the TCP stream.
+        With `multicast_group` (host, port) the group is joined directly,
+        otherwise the server is told which local port to send to.
+        """
+        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if multicast_group:
+            self.udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.udp_socket.bind(("", multicast_group[1]))
+            membership = socket.inet_aton(multicast_group[0]) + socket.inet_aton("0.0.0.0")
+            self.udp_socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        else:
+            self.udp_socket.bind((self.client_socket.getsockname()[0], port))
+            self.send_data({"udp_port": self.udp_socket.getsockname()[1]})
+
+        udp_thread = threading.Thread(target=self.receive_udp, args=(player_id,), daemon=True)
+        udp_thread.start()
+        return udp_thread
+
+    def receive_udp(self, player_id):
+        try:
+            while True:
+                data, _ = self.udp_socket.recvfrom(65535)
+                try:
+                    seq, _, world = decode_datagram(data)
+                except (ProtocolError, json.JSONDecodeError):
+                    continue
+                # Late or duplicated datagram, a newer state is already applied
+                if self.udp_seq is not None and not seq_newer(seq, self.udp_seq):
+                    self.udp_stale += 1
+                    continue
+                self.udp_seq = seq
+                self.server_response_data = view_for_player(world, player_id)
+        except OSError as e:
+            print(f"UDP state channel closed: {e}")
+
     def close(self):
+        if self.udp_socket:
+            self.udp_socket.close()
         self.client_socket.close()
         print("Connection closed.")
 
 
+def seq_newer(seq, last):
+    """Whether datagram sequence number `seq` comes after `last`, allowing for 32-bit wraparound."""
+    return 0 < (seq - last) & 0xFFFFFFFF < 0x80000000
+
+
+def view_for_player(world, player_id):
+    """The state a TCP client would get for `player_id`, built from a UDP world snapshot."""
+    if player_id not in world["players"]:
+        return world
+    ball = world["ball"]
+    return {
+        "player": world["players"][player_id],
+        "target_pos": ball["pos"],
+        "target_velocity": ball["velocity"],
+        "goal_pos": world["goals"][world["goal_tags"][player_id]],
+        "timestamp": world["timestamp"],
+    }
+
+
 class KeyListener:
     def __init__(self, player,client):
         self.player = player
@@ -136,6 +278,8 @@ def main():
     # Connect to server
     client.connect()
     client.send_data(player.to_dict())
+    if udp_state_flag:
+        client.subscribe_udp(player.player_id)
 
     # Start listening for key events in a separate thread
    
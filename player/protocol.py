@@ -0,0 +1,318 @@
+"""
+Wire protocol shared by the socket server and the player client.
+
+A client opens the connection with a hello (MAGIC, version, requested
+encoding) and the server answers with the encoding it accepted. After that
+every message is a frame: a 4-byte big-endian payload length, a 1-byte
+message type and the payload. Payloads are either JSON or, with
+ENCODING_BINARY, a packed struct for state and command messages. Clients
+that start talking JSON straight away are served with the old unframed
+JSON stream.
+
+server/protocol.py is a copy of this file, keep the two in sync.
+"""
+import codecs
+import json
+import math
+import struct
+
+MAGIC = b"ZIOS"
+VERSION = 1
+
+ENCODING_JSON = 0
+ENCODING_BINARY = 1
+ENCODINGS = (ENCODING_JSON, ENCODING_BINARY)
+
+MSG_JSON = 0
+MSG_STATE = 1
+MSG_COMMAND = 2
+
+HELLO = struct.Struct("!4sBB")  # magic, version, encoding
+DATAGRAM_MAGIC = b"ZUDP"
+DATAGRAM = struct.Struct("!4sId")  # magic, sequence number, capture timestamp
+HEADER = struct.Struct("!IB")  # payload length, message type
+MAX_FRAME_SIZE = 1 << 20
+
+POSE = struct.Struct("!6f")
+POINT = struct.Struct("!2f")
+ZERO_POSE = (0, 0, 0, 0, 0, 0)
+
+STATE_KEYS = {"player", "target_pos", "target_velocity", "goal_pos", "timestamp", "snapshot"}
+PLAYER_KEYS = {"id", "pos", "velocity", "timestamp", "boost_available"}
+COMMAND_KEYS = {"player_id", "velocity", "actions", "trace"}
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class MessageError(ProtocolError):
+    """
+    Raised by the readers when received messages could not be decoded. The
+    bad input has been consumed, so the connection can carry on; `messages`
+    holds the messages that were decoded fine in the same feed() call.
+    """
+    def __init__(self, reason, messages):
+        super().__init__(reason)
+        self.messages = messages
+
+
+def make_hello(encoding):
+    return HELLO.pack(MAGIC, VERSION, encoding)
+
+
+def hello_incomplete(data):
+    """True while the first bytes of a stream could still turn out to be a hello."""
+    return len(data) < HELLO.size and MAGIC.startswith(data[:len(MAGIC)])
+
+
+def parse_hello(data):
+    """Returns (version, encoding) from a hello, raises ProtocolError if it is not one."""
+    if len(data) < HELLO.size or not data.startswith(MAGIC):
+        raise ProtocolError("Not a protocol hello")
+    _, version, encoding = HELLO.unpack_from(data)
+    return version, encoding
+
+
+def _time(value):
+    return math.nan if value is None else float(value)
+
+
+def _untime(value):
+    return None if math.isnan(value) else value
+
+
+def _pack_str(value):
+    raw = value.encode("utf-8")
+    if len(raw) > 255:
+        raise ValueError("String too long for binary encoding")
+    return struct.pack("!B", len(raw)) + raw
+
+
+def _unpack_str(payload, offset):
+    length = payload[offset]
+    return payload[offset + 1:offset + 1 + length].decode("utf-8"), offset + 1 + length
+
+
+def encode_state(state):
+    """Pack a per-player state message, raises ValueError if it has fields the format does not know."""
+    player = state["player"]
+    if not set(state) <= STATE_KEYS or not set(player) <= PLAYER_KEYS:
+        raise ValueError("State has fields the binary encoding does not carry")
+
+    goal_pos = state["goal_pos"]
+    parts = [
+        struct.pack("!d", _time(state.get("timestamp"))),
+        _pack_str(player["id"]),
+        POSE.pack(*player["pos"]),
+        POSE.pack(*player.get("velocity", ZERO_POSE)),
+        struct.pack("!d?", _time(player.get("timestamp")), bool(player.get("boost_available", False))),
+        POSE.pack(*state["target_pos"]),
+        POSE.pack(*state.get("target_velocity", ZERO_POSE)),
+        struct.pack("!B", len(goal_pos)),
+    ]
+    parts.extend(POINT.pack(*point) for point in goal_pos)
+    parts.append(struct.pack("!I", state.get("snapshot", 0)))
+    return b"".join(parts)
+
+
+def decode_state(payload):
+    (timestamp,) = struct.unpack_from("!d", payload, 0)
+    player_id, offset = _unpack_str(payload, 8)
+    pos = POSE.unpack_from(payload, offset)
+    velocity = POSE.unpack_from(payload, offset + POSE.size)
+    offset += 2 * POSE.size
+    player_timestamp, boost_available = struct.unpack_from("!d?", payload, offset)
+    offset += 9
+    target_pos = POSE.unpack_from(payload, offset)
+    target_velocity = POSE.unpack_from(payload, offset + POSE.size)
+    offset += 2 * POSE.size
+    (goal_count,) = struct.unpack_from("!B", payload, offset)
+    offset += 1
+    goal_pos = [POINT.unpack_from(payload, offset + i * POINT.size) for i in range(goal_count)]
+    offset += goal_count * POINT.size
+    (snapshot,) = struct.unpack_from("!I", payload, offset)
+
+    state = {
+        "player": {
+            "id": player_id,
+            "pos": pos,
+            "velocity": velocity,
+            "timestamp": _untime(player_timestamp),
+            "boost_available": boost_available,
+        },
+        "target_pos": target_pos,
+        "target_velocity": target_velocity,
+        "goal_pos": goal_pos,
+        "timestamp": _untime(timestamp),
+    }
+    if snapshot:
+        state["snapshot"] = snapshot
+    return state
+
+
+def encode_command(command):
+    """Pack a player command, raises ValueError if it has fields the format does not know."""
+    actions = command.get("actions", {})
+    if not set(command) <= COMMAND_KEYS or not set(actions) <= {"boost"}:
+        raise ValueError("Command has fields the binary encoding does not carry")
+    v, w = command.get("velocity", (0, 0))
+    payload = _pack_str(command["player_id"]) + struct.pack("!2f?", v, w, bool(actions.get("boost", False)))
+    if "trace" in command:
+        # Optional trailer, older decoders ignore it
+        payload += struct.pack("!d", _time(command["trace"]))
+    return payload
+
+
+def decode_command(payload):
+    player_id, offset = _unpack_str(payload, 0)
+    v, w, boost = struct.unpack_from("!2f?", payload, offset)
+    command = {"player_id": player_id, "velocity": (v, w), "actions": {"boost": boost}}
+    offset += 9
+    if len(payload) >= offset + 8:
+        command["trace"] = _untime(struct.unpack_from("!d", payload, offset)[0])
+    return command
+
+
+def encode_message(data, encoding=ENCODING_JSON, json_payload=None):
+    """
+    Frame a message, using the binary encoding where it can carry the message.
+    `json_payload` is the message already serialized to JSON, if available.
+    """
+    msg_type, payload = MSG_JSON, None
+    if encoding == ENCODING_BINARY:
+        try:
+            if "player_id" in data:
+                msg_type, payload = MSG_COMMAND, encode_command(data)
+            elif "player" in data:
+                msg_type, payload = MSG_STATE, encode_state(data)
+        except (KeyError, TypeError, ValueError, struct.error):
+            msg_type, payload = MSG_JSON, None
+
+    if payload is None:
+        payload = json_payload or json.dumps(data).encode("utf-8")
+    return HEADER.pack(len(payload), msg_type) + payload
+
+
+def decode_message(msg_type, payload):
+    if msg_type == MSG_STATE:
+        return decode_state(payload)
+    if msg_type == MSG_COMMAND:
+        return decode_command(payload)
+    if msg_type == MSG_JSON:
+        return json.loads(payload.decode("utf-8"))
+    raise ProtocolError(f"Unknown message type {msg_type}")
+
+
+def encode_datagram(seq, timestamp, payload):
+    """UDP state datagram: header followed by the JSON world snapshot."""
+    return DATAGRAM.pack(DATAGRAM_MAGIC, seq & 0xFFFFFFFF, _time(timestamp)) + payload
+
+
+def decode_datagram(data):
+    """Returns (seq, timestamp, world), raises ProtocolError for foreign packets."""
+    if len(data) < DATAGRAM.size or not data.startswith(DATAGRAM_MAGIC):
+        raise ProtocolError("Not a state datagram")
+    _, seq, timestamp = DATAGRAM.unpack_from(data)
+    return seq, _untime(timestamp), json.loads(data[DATAGRAM.size:].decode("utf-8"))
+
+
+class FrameReader:
+    """Reassembles frames from a byte stream, however it was split or merged by recv()."""
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """
+        Add received bytes, returns the list of complete decoded messages.
+        Raises MessageError after the last frame if any frame could not be decoded.
+        """
+        self.buffer.extend(data)
+        messages = []
+        errors = []
+        while len(self.buffer) >= HEADER.size:
+            length, msg_type = HEADER.unpack_from(self.buffer)
+            if length > MAX_FRAME_SIZE:
+                raise ProtocolError(f"Frame of {length} bytes exceeds the limit")
+            end = HEADER.size + length
+            if len(self.buffer) < end:
+                break
+            payload = bytes(self.buffer[HEADER.size:end])
+            del self.buffer[:end]
+            try:
+                messages.append(decode_message(msg_type, payload))
+            except (struct.error, UnicodeDecodeError, ValueError, ProtocolError) as e:
+                errors.append(f"type {msg_type}: {e}")
+        if errors:
+            raise MessageError(f"Malformed message ({'; '.join(errors)})", messages)
+        return messages
+
+
+class JSONStreamReader:
+    """Splits the legacy unframed stream of concatenated JSON objects."""
+    def __init__(self):
+        self.buffer = ""
+        self.decoder = json.JSONDecoder()
+        # Keeps a multi-byte character split across two reads until its last byte arrives
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+
+    def feed(self, data):
+        """
+        Add received bytes, returns the complete objects. On garbage the buffer is
+        dropped and MessageError is raised with the objects decoded before it.
+        """
+        messages = []
+        try:
+            self.buffer += self.text_decoder.decode(data)
+        except UnicodeDecodeError:
+            self.buffer = ""
+            self.text_decoder.reset()
+            raise MessageError("Invalid JSON format", messages)
+
+        garbage = False
+        while True:
+            self.buffer = self.buffer.lstrip()
+            if not self.buffer:
+                break
+            try:
+                message, end = self.decoder.raw_decode(self.buffer)
+            except json.JSONDecodeError:
+                # Still arriving if its braces have not closed yet, otherwise skip past the bad object
+                end = _object_end(self.buffer) if self.buffer[0] == "{" else self.buffer.find("{", 1)
+                if end is None and len(self.buffer) <= MAX_FRAME_SIZE:
+                    break
+                garbage = True
+                self.buffer = "" if end is None or end < 0 else self.buffer[end:]
+                continue
+            self.buffer = self.buffer[end:]
+            if isinstance(message, dict):
+                messages.append(message)
+            else:
+                garbage = True
+
+        if garbage:
+            raise MessageError("Invalid JSON format", messages)
+        return messages
+
+
+def _object_end(text):
+    """Index just past the brace closing the object `text` starts with, None if it is not closed yet."""
+    depth = 0
+    in_string = escaped = False
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    return None
@@ -0,0 +1,238 @@
+import asyncio
+import queue
+import threading
+from protocol import (HELLO, hello_incomplete, ENCODINGS, ENCODING_JSON, ENCODING_BINARY, make_hello, parse_hello,
+                      FrameReader, JSONStreamReader, ProtocolError, MessageError)
+from outbound_queue import OutboundQueue, STATE_KEY
+from state_encoder import StateEncoder, serialize_message, state_trace
+from udp_state_channel import UDPStatePublisher
+from latency_tracer import tracer
+
+
+class AsyncSocketClient:
+    """One player connection served by the event loop."""
+    def __init__(self, interface, reader, writer):
+        self.interface = interface
+        self.reader = reader
+        self.writer = writer
+        self.client_address = writer.get_extra_info("peername")
+        self.player_id = ""
+        self.spectator = False  # Spectators receive the whole world instead of a player's view
+        self.acked_snapshot = None  # Last state snapshot the client acknowledged, enables deltas
+        self.udp_address = None  # Set when the client takes game state over UDP instead of TCP
+        self.encoding = None  # None for legacy unframed JSON, otherwise the negotiated frame encoding
+        self.outbox = OutboundQueue()
+        self.wakeup = asyncio.Event()
+        self.active = True
+
+    async def negotiate(self):
+        """Async counterpart of SocketClient.negotiate."""
+        data = b""
+        while hello_incomplete(data):
+            chunk = await self.reader.read(1024)
+            if not chunk:
+                return None, b""
+            data += chunk
+
+        try:
+            version, encoding = parse_hello(data)
+        except ProtocolError:
+            return JSONStreamReader(), data
+
+        self.encoding = encoding if encoding in ENCODINGS else ENCODING_JSON
+        self.writer.write(make_hello(self.encoding))
+        print(f"Client {self.client_address} negotiated protocol v{version}, encoding {self.encoding}")
+        return FrameReader(), data[HELLO.size:]
+
+    async def handle(self):
+        writer_task = asyncio.create_task(self.write_loop())
+        try:
+            stream_reader, data = await self.negotiate()
+            while self.active and stream_reader:
+                if data:
+                    try:
+                        messages = stream_reader.feed(data)
+                    except MessageError as e:
+                        # The bad message is skipped, everything decoded around it is still handled
+                        print(f"Failed to decode message from {self.client_address}: {e}")
+                        self.enqueue({"error": str(e)})
+                        messages = e.messages
+
+                    for json_data in messages:
+                        if "ack" in json_data:
+                            self.acked_snapshot = json_data["ack"]
+                            continue
+                        if "udp_port" in json_data:
+                            self.udp_address = (self.client_address[0], json_data["udp_port"])
+                            self.interface.udp_publisher.subscribe(self.udp_address)
+                            print(f"Client {self.client_address} takes state over UDP on {self.udp_address}")
+                            continue
+                        if json_data.get("spectator"):
+                            self.spectator = True
+                            print(f"Client {self.client_address} is spectating")
+                            continue
+
+                        if not self.player_id:
+                            self.player_id = json_data.get("player_id", "")
+                            self.interface.register(self)
+                            print(f"Client {self.client_address} identified as {self.player_id}")
+
+                        # Hand over to the manager without blocking the event loop
+                        self.interface.inbound.put(json_data)
+
+                data = await self.reader.read(4096)
+                if not data:
+                    break
+        except ProtocolError as e:
+            print(f"Protocol error from {self.client_address}: {e}")
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.active = False
+            writer_task.cancel()
+            self.interface.unregister(self)
+            self.writer.close()
+            print(f"Connection to {self.client_address} closed.")
+
+    def delta_base(self):
+        """
+        Snapshot to send the next state as a delta against. Deltas are JSON, so
+        binary player connections always get full states, which are smaller.
+        """
+        if self.encoding == ENCODING_BINARY and self.player_id:
+            return None
+        return self.acked_snapshot
+
+    def enqueue(self, data, key=None):
+        """Queue a message for this client. Must be called on the event loop."""
+        if self.active:
+            self.outbox.put(data, key)
+            self.wakeup.set()
+
+    async def write_loop(self):
+        try:
+            while True:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                while (data := self.outbox.get_nowait()) is not None:
+                    self.writer.write(serialize_message(data, self.encoding))
+                    await self.writer.drain()
+                    tracer.mark(state_trace(data), "state_sent")
+        except (ConnectionError, OSError):
+            # Closing the writer ends the read in handle(), which unregisters the client
+            self.active = False
+            self.writer.close()
+
+
+class AsyncSocketInterface:
+    """
+    Serves every player connection from a single asyncio event loop.
+
+    Drop-in replacement for SocketInterface: run_server() blocks the calling
+    thread running the loop, and send_to_client()/broadcast_to_clients() may be
+    called from any thread. Incoming player messages go through a thread-safe
+    queue to a dispatcher thread that calls manager.process_player_data, so
+    slow manager code never stalls the network loop.
+    """
+    def __init__(self, manager, host='127.0.0.1', port=65432, multicast_group=None):
+        self.manager = manager
+        self.host = host
+        self.port = port
+        self.loop = None
+        self.players = {}  # player_id -> AsyncSocketClient, only touched on the event loop
+        self.clients = set()
+        self.inbound = queue.Queue()
+        self.state_encoder = StateEncoder()
+        self.udp_publisher = UDPStatePublisher(multicast_group)
+
+    def register(self, client):
+        self.players[client.player_id] = client
+
+    def unregister(self, client):
+        self.clients.discard(client)
+        if client.udp_address:
+            self.udp_publisher.unsubscribe(client.udp_address)
+        self.state_encoder.forget(client)
+        if self.players.get(client.player_id) is client:
+            del self.players[client.player_id]
+
+    def send_to_client(self, client_name, data):
+        """Queues game state for a specific client, safe to call from any thread."""
+        if self.loop:
+            self.loop.call_soon_threadsafe(self._send_to_client, client_name, data)
+
+    def broadcast_to_clients(self, data):
+        """Sends data to all connected clients, safe to call from any thread."""
+        if self.loop:
+            self.loop.call_soon_threadsafe(self._broadcast_to_clients, data)
+
+    def publish_state(self, world, goal_tags):
+        """Sends one world snapshot to every player and spectator, safe to call from any thread."""
+        self.udp_publisher.publish(world, goal_tags)
+        if self.loop:
+            self.loop.call_soon_threadsafe(self._publish_state, world, goal_tags)
+
+    def _publish_state(self, world, goal_tags):
+        self.state_encoder.begin_frame(world, goal_tags)
+        for client in self.clients:
+            if (client.player_id or client.spectator) and not client.udp_address:
+                message = self.state_encoder.message_for(client, client.player_id, client.delta_base())
+                client.enqueue(message, STATE_KEY)
+
+    def _send_to_client(self, client_name, data):
+        client = self.players.get(client_name)
+        if client:
+            client.enqueue(data, STATE_KEY)
+
+    def _broadcast_to_clients(self, data):
+        for client in self.clients:
+            client.enqueue(data)
+
+    def get_send_stats(self):
+        """Outbound queue counters per connected client."""
+        return {client.player_id or str(client.client_address): client.outbox.get_stats()
+                for client in list(self.clients)}
+
+    async def handle_connection(self, reader, writer):
+        client = AsyncSocketClient(self, reader, writer)
+        self.clients.add(client)
+        print(f"Connection from {client.client_address} established!")
+        await client.handle()
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        print(f"Async server started. Listening on {self.host}:{self.port}...")
+        async with server:
+            while self.manager.running:
+                await asyncio.sleep(0.2)
+
+            for client in list(self.clients):
+                client.active = False
+                client.writer.close()
+        self.loop = None
+
+    def dispatch_player_data(self):
+        """Feeds queued player messages to the manager on a thread of its own."""
+        while self.manager.running:
+            try:
+                data = self.inbound.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            try:
+                self.manager.process_player_data(data)
+            except Exception as e:
+                print(f"Error processing player data: {e}")
+
+    def run_server(self):
+        """Runs the event loop until the manager stops."""
+        dispatcher = threading.Thread(target=self.dispatch_player_data, daemon=True)
+        dispatcher.start()
+        try:
+            asyncio.run(self.serve())
+        except Exception as e:
+            print(f"Server error: {e}")
+        finally:
+            dispatcher.join(1)
+            self.udp_publisher.close()
+            print("Socket Server closed.")
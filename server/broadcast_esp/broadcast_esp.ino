@@ -4,6 +4,14 @@
 
 #define PLAYER_COUNT 2
 #define BAUD_RATE 115200
+// 1 for the binary packets of server/serial_protocol.py, 0 for JSON lines
+#define BINARY_PROTOCOL 0
+
+#define SYNC_0 0xAA
+#define SYNC_1 0x55
+#define PKT_COMMANDS 0x01
+#define PKT_TELEMETRY 0x02
+#define COMMAND_SIZE 5
 
 // Array of MAC addresses for each player
 uint8_t addresses[PLAYER_COUNT][6] = {
@@ -36,7 +44,12 @@ void onDataSent(const uint8_t *macAddr, esp_now_send_status_t status) {
 void onDataRecv(const esp_now_recv_info_t *recvInfo, const uint8_t *incomingData, int len) {
   bot_data receivedData;
   memcpy(&receivedData, incomingData, sizeof(receivedData));
-  
+
+#if BINARY_PROTOCOL
+  sendTelemetry(getMacAddress(receivedData.botId), receivedData.ldrVal, 1);
+  return;
+#endif
+
   Serial.print("{\"id\": \"");
   Serial.print(receivedData.botId);
   Serial.print("\", \"ldr\": ");
@@ -70,12 +83,93 @@ void setup() {
     peerInfo.encrypt = false;
 
     if (esp_now_add_peer(&peerInfo) != ESP_OK) {
-      Serial.println("{\"succ\": 0}");
+      reportFailure(i);
+    }
+  }
+}
+
+uint8_t crc8(const uint8_t *data, int len) {
+  uint8_t crc = 0;
+  for (int i = 0; i < len; i++) {
+    crc ^= data[i];
+    for (int bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x80) ? (crc << 1) ^ 0x07 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+// Telemetry packet for robot `index`, 0xFF when unknown; `succ` 0 reports a failed send
+void sendTelemetry(int index, int ldrVal, uint8_t succ) {
+  uint8_t telemetry[9] = {SYNC_0, SYNC_1, PKT_TELEMETRY, 4,
+                          (uint8_t)(index < 0 ? 0xFF : index),
+                          (uint8_t)(ldrVal & 0xFF), (uint8_t)(ldrVal >> 8), succ, 0};
+  telemetry[8] = crc8(telemetry + 2, 6);
+  Serial.write(telemetry, sizeof(telemetry));
+}
+
+// Error reply for robot `index`, in the format the host is reading
+void reportFailure(int index) {
+#if BINARY_PROTOCOL
+  sendTelemetry(index, 0, 0);
+#else
+  Serial.println("{\"succ\": 0}");
+#endif
+}
+
+void sendCommand(int macIndex, const char *botId, int v, int w) {
+  strncpy(myData.botId, botId, sizeof(myData.botId));
+  myData.v = v;
+  myData.w = w;
+
+  esp_err_t result = esp_now_send(addresses[macIndex], (uint8_t *)&myData, sizeof(myData));
+  if (result != ESP_OK) {
+    reportFailure(macIndex);
+  }
+}
+
+// Parser state for binary packets: sync, type, length, payload, crc
+uint8_t packet[4 + 255 + 1];
+int packetLen = 0;
+
+void handleCommandPacket(const uint8_t *payload, int len) {
+  for (int i = 0; i + COMMAND_SIZE <= len; i += COMMAND_SIZE) {
+    int index = payload[i];
+    int16_t v = (int16_t)(payload[i + 1] | (payload[i + 2] << 8));
+    int16_t w = (int16_t)(payload[i + 3] | (payload[i + 4] << 8));
+    if (index < PLAYER_COUNT) {
+      sendCommand(index, playerIds[index], v, w);
+    }
+  }
+}
+
+void readBinary() {
+  while (Serial.available() > 0) {
+    uint8_t b = Serial.read();
+    if (packetLen == 0 && b != SYNC_0) continue;
+    if (packetLen == 1 && b != SYNC_1) {
+      packetLen = (b == SYNC_0) ? 1 : 0;
+      continue;
+    }
+    packet[packetLen++] = b;
+    if (packetLen < 4) continue;
+
+    int payloadLen = packet[3];
+    if (packetLen == 4 + payloadLen + 1) {
+      if (crc8(packet + 2, 2 + payloadLen) == packet[4 + payloadLen] && packet[2] == PKT_COMMANDS) {
+        handleCommandPacket(packet + 4, payloadLen);
+      }
+      packetLen = 0;
     }
   }
 }
 
 void loop() {
+#if BINARY_PROTOCOL
+  readBinary();
+  return;
+#endif
+
   // Check if data is available to read
   if (Serial.available() > 0) {
     String incomingData = Serial.readStringUntil('\n');  // Read data until newline
@@ -91,15 +185,8 @@ void loop() {
     sscanf(w_str.c_str(), "%d", &w);
 
     if (macIndex != -1) {
-      strncpy(myData.botId, player_id.c_str(), sizeof(myData.botId));
-      myData.v = v;
-      myData.w = w;
-
       // Send data to the selected peer
-      esp_err_t result = esp_now_send(addresses[macIndex], (uint8_t *)&myData, sizeof(myData));
-      if (result != ESP_OK) {
-        Serial.println("{\"succ\": 0}");
-      }
+      sendCommand(macIndex, player_id.c_str(), v, w);
     } else {
       Serial.println("{\"succ\": 0}");
     }
@@ -0,0 +1,106 @@
+import numpy as np
+from collections import deque
+from enum import Enum
+
+
+class CalibrationState(Enum):
+    CALIBRATING = "calibrating"
+    LOCKED = "locked"
+
+
+class BoundaryCalibrator:
+    """
+    Calibration state machine for the arena boundary corners.
+
+    While CALIBRATING the corners are smoothed with a running sum over the
+    last `window_size` detections. Once the smoothed corners move less than
+    `stable_tolerance` pixels for `stable_frames` frames in a row they are
+    LOCKED and boundary detection is only needed every `drift_check_interval`
+    frames. If `drift_checks` checks in a row find the corners more than
+    `drift_tolerance` pixels away, calibration starts over.
+    """
+    def __init__(self, window_size=20, stable_tolerance=1.0, stable_frames=20,
+                 drift_check_interval=30, drift_tolerance=5.0, drift_checks=3, lock=True):
+        self.window_size = window_size
+        self.stable_tolerance = stable_tolerance
+        self.stable_frames = stable_frames
+        self.drift_check_interval = drift_check_interval
+        self.drift_tolerance = drift_tolerance
+        self.drift_checks = drift_checks
+        self.lock = lock
+
+        self.state = CalibrationState.CALIBRATING
+        self.window = deque()
+        self.window_sum = np.zeros((4, 2), dtype=np.float64)
+        self.corners = None  # Current smoothed corners, None until the first detection
+        self.stable_count = 0
+        self.frames_since_check = 0
+        self.drift_count = 0
+        self.recalibrations = 0
+
+    @property
+    def locked(self):
+        return self.state == CalibrationState.LOCKED
+
+    def begin_frame(self):
+        """Advance one frame, returns True if the boundary should be detected in it."""
+        if not self.locked:
+            return True
+
+        self.frames_since_check += 1
+        if self.frames_since_check >= self.drift_check_interval:
+            self.frames_since_check = 0
+            return True
+        return False
+
+    def update(self, src_pts):
+        """Feed the ordered corners detected this frame (or None), returns the smoothed corners."""
+        if self.locked:
+            if src_pts is not None:
+                self.check_drift(src_pts)
+            return self.corners
+
+        if src_pts is None:
+            return self.corners
+
+        # Running sum over the window, O(1) per frame
+        src_pts = np.asarray(src_pts, dtype=np.float64)
+        self.window.append(src_pts)
+        self.window_sum += src_pts
+        if len(self.window) > self.window_size:
+            self.window_sum -= self.window.popleft()
+
+        corners = (self.window_sum / len(self.window)).astype(np.float32)
+        if (self.corners is not None and len(self.window) == self.window_size
+                and np.max(np.abs(corners - self.corners)) < self.stable_tolerance):
+            self.stable_count += 1
+        else:
+            self.stable_count = 0
+        self.corners = corners
+
+        if self.lock and self.stable_count >= self.stable_frames:
+            self.state = CalibrationState.LOCKED
+            self.frames_since_check = 0
+            self.drift_count = 0
+            print(f"Boundary locked at {self.corners.tolist()}")
+
+        return self.corners
+
+    def check_drift(self, src_pts):
+        if np.max(np.abs(np.asarray(src_pts) - self.corners)) > self.drift_tolerance:
+            self.drift_count += 1
+        else:
+            self.drift_count = 0
+
+        if self.drift_count >= self.drift_checks:
+            print("Boundary drifted, recalibrating.")
+            self.recalibrate()
+
+    def recalibrate(self):
+        """Drop the lock and start smoothing from scratch, keeping the last corners meanwhile."""
+        self.state = CalibrationState.CALIBRATING
+        self.window.clear()
+        self.window_sum[:] = 0
+        self.stable_count = 0
+        self.drift_count = 0
+        self.recalibrations += 1
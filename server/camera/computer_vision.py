@@ -1,21 +1,50 @@
 import cv2
 import numpy as np
-import json
-from collections import deque
+import time
 from camera.color_ranges import COLOR_RANGES
 from camera.arena_entity import *
 from camera.utils import *
-from enum import Enum
+from camera.marker_detector import MarkerDetector
+from camera.frame_pipeline import LatestFrameSlot, FrameGrabber
+from camera.preview_server import PreviewServer
+from camera.vision_workers import VisionWorkerPool
+from camera.boundary_calibrator import BoundaryCalibrator
+from camera.entity_tracker import EntityTracker
+from camera.pose_filter import PoseFilterBank
+from camera.vision_profiler import profiler
+from camera.frame_source import open_frame_source, FrameRecorder, RecordingSource
 
 
 class ComputerVisionManager:
-    def __init__(self, manager, config_path, width=1000, height=1000):
+    def __init__(self, manager, config_path, width=1000, height=1000, use_color_lut=False, track_markers=True,
+                 pipelined=False, max_frame_age=0.1, headless=False, preview_port=None,
+                 use_workers=False, homography_tolerance=0.5, lock_boundary=True,
+                 pyramid_scale=None, track_entities=True,
+                 filter_poses=True, pose_lead_time=0.0, profile_interval=None,
+                 frame_source=0, paced_replay=False, record_path=None):
         # Initialize parameters
         self.width = width
         self.height = height
-        self.src_history = deque(maxlen=20)  # Fixed-size queue for smoothing boundary points
+        self.calibrator = BoundaryCalibrator(window_size=20, lock=lock_boundary)  # Smooths and locks boundary points
+        self.detect_boundary = True  # Whether boundary markers are looked for in the current frame
         self.response_model = {}  # Public response model to store results
 
+        # Destination corners are fixed, the homography is only recomputed when
+        # the smoothed source corners move more than homography_tolerance pixels
+        self.dst_pts = order_points(np.float32([[0, 0], [width, 0], [width, height], [0, height]]))
+        self.homography_tolerance = homography_tolerance
+        self.homography_src = None
+        self.homography = None
+
+        # Precomputed HSV -> color label table for single-pass color detection
+        self.color_lut = ColorLUT(COLOR_RANGES) if use_color_lut else None
+
+        # Detect on an image downscaled by this factor, then refine at full resolution
+        self.pyramid_scale = pyramid_scale
+
+        # ArUco detector built once and reused, with ROI tracking between frames
+        self.marker_detector = MarkerDetector(roi_tracking=track_markers, pyramid_scale=pyramid_scale)
+
         # Load entities from JSON configuration
         self.created_entities = create_entities_from_json(config_path)
         self.aruco_entities = [
@@ -25,88 +54,297 @@ class ComputerVisionManager:
             entity for entity in self.created_entities if entity.color is not None
         ]
 
-        # Camera object
+        # Boundary markers can be skipped entirely once the boundary is locked
+        non_boundary_aruco_ids = {
+            entity.aruco_id for entity in self.aruco_entities if entity.entity_type != EntityType.BOUNDARY
+        }
+        self.boundary_aruco_ids = {
+            entity.aruco_id for entity in self.aruco_entities if entity.entity_type == EntityType.BOUNDARY
+        } - non_boundary_aruco_ids
+        self.boundary_markers_ignored = False  # Whether the last marker scan left out the boundary markers
+
+        # Temporal tracker keeping entity identities stable, and predicting where
+        # color entities are so detection can skip most of the frame
+        self.tracker = EntityTracker() if track_entities else None
+
+        # Kalman-filtered pose and velocity per entity; poses can be extrapolated
+        # `pose_lead_time` seconds past capture to cover the command latency
+        self.pose_filter = PoseFilterBank() if filter_poses else None
+        self.pose_lead_time = pose_lead_time
+
+        # Color and marker detection in separate processes, fed through shared memory
+        self.workers = VisionWorkerPool(use_color_lut, track_markers, pyramid_scale) if use_workers else None
+
+        # Pipelined mode: capture thread feeding a latest-frame-wins slot
+        self.pipelined = pipelined
+        self.max_frame_age = max_frame_age  # Seconds before a captured frame is considered stale
+        self.frame_slot = None
+        self.grabber = None
+        self.stale_dropped = 0
+        self.frames_processed = 0
+
+        # Headless mode skips all warping and rendering on the hot path,
+        # an optional preview server renders annotated frames on its own thread
+        self.headless = headless
+        self.preview = PreviewServer(width, height, port=preview_port) if preview_port else None
+
+        # Per-stage timings, summarized every profile_interval seconds (0 to stay quiet). The
+        # profiler is shared with the helper modules, so the interval is only changed when given
+        self.profiler = profiler
+        if profile_interval is not None:
+            self.profiler.report_interval = profile_interval
+
+        # Camera index, recorded video or image directory (see frame_source), optionally
+        # replayed at the recorded pace; live frames can be recorded to record_path
+        self.frame_source = frame_source
+        self.paced_replay = paced_replay
+        self.record_path = record_path
         self.cam = None
         self.manager = manager
 
     def init_camera(self):
-        """Initialize the camera settings."""
-        self.cam = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-        self.cam.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
-        self.cam.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        """Open the frame source, recording what it delivers when record_path is set."""
+        self.cam = open_frame_source(self.frame_source, self.width, self.height, paced=self.paced_replay)
+        if self.record_path:
+            self.cam = RecordingSource(self.cam, FrameRecorder(self.record_path))
+
+    def active_entities(self):
+        """Color and ArUco entities to locate this frame, without the boundary once it is locked."""
+        color_entities, aruco_entities = self.color_entities, self.aruco_entities
+        if not self.detect_boundary:
+            color_entities = [entity for entity in color_entities if entity.entity_type != EntityType.BOUNDARY]
+            aruco_entities = [entity for entity in aruco_entities if entity.entity_type != EntityType.BOUNDARY]
+        return color_entities, aruco_entities
 
-    def process_frame(self, image):
-        """Process a single frame and update the response model."""
-        # Detect features
-        shape_color_points = detect_shapes_and_colors(image)
-        aruco_marker_points = detect_aruco_markers(image)
+    def detect_features(self, image):
+        """Run color and marker detection on a frame, in worker processes when enabled."""
+        color_entities, aruco_entities = self.active_entities()
+        ignore_ids = set() if self.detect_boundary else self.boundary_aruco_ids
+        # Skip marker detection altogether when only boundary markers are configured
+        detect_markers = len(aruco_entities) > 0
+        # Boundary markers ignored so far are not tracked, a drift check has to scan the whole frame for them
+        full_scan = self.detect_boundary and self.boundary_markers_ignored
+        if detect_markers:
+            self.boundary_markers_ignored = bool(ignore_ids)
 
+        # Only search around the predicted positions while every color entity is tracked
+        regions = None
+        if self.tracker and color_entities:
+            height, width = image.shape[:2]
+            with self.profiler.stage("search_regions"):
+                regions = self.tracker.search_regions(color_entities, width, height)
+
+        if self.workers:
+            with self.profiler.stage("workers"):
+                return self.workers.detect(image, ignore_ids, detect_markers, regions, full_scan)
+
+        shape_color_points = detect_shapes_and_colors(image, self.color_lut, self.pyramid_scale, regions=regions)
+        aruco_marker_points = []
+        if detect_markers:
+            self.marker_detector.ignore_ids = ignore_ids
+            with self.profiler.stage("aruco"):
+                aruco_marker_points = self.marker_detector.detect(image, full_scan)
+        return shape_color_points, aruco_marker_points
+
+    def process_frame(self, image, timestamp=None):
+        """Process a single frame captured at `timestamp` and update the response model."""
+        if timestamp is None:
+            timestamp = time.time()
+
+        # Detect features, boundary markers only while calibrating or on a drift check
+        self.detect_boundary = self.calibrator.begin_frame()
+        if self.tracker:
+            self.tracker.begin_frame()
+        shape_color_points, aruco_marker_points = self.detect_features(image)
+        return self.process_detections(shape_color_points, aruco_marker_points, timestamp)
+
+    def process_detections(self, shape_color_points, aruco_marker_points, timestamp=None):
+        """Turn raw detections into entity poses and update the response model."""
         # Get positions of entities
-        entity_pos = []
-        entity_pos.extend(assign_positions_to_color_entities(self.color_entities, shape_color_points))
-        entity_pos.extend(assign_positions_to_aruco_entities(self.aruco_entities, aruco_marker_points))
+        color_entities, aruco_entities = self.active_entities()
 
-        # Categorize entities
-        entity_data = categorize_entity(entity_pos)
+        entity_pos = []
+        with self.profiler.stage("assignment"):
+            if self.tracker:
+                entity_pos.extend(self.tracker.assign_color(color_entities, shape_color_points))
+                entity_pos.extend(self.tracker.assign_aruco(aruco_entities, aruco_marker_points))
+            else:
+                entity_pos.extend(assign_positions_to_color_entities(color_entities, shape_color_points))
+                entity_pos.extend(assign_positions_to_aruco_entities(aruco_entities, aruco_marker_points))
 
-        # Check if we have enough boundary points
-        if len(entity_data[EntityType.BOUNDARY]) >= 4:
-            # Extract and order boundary points
-            boundary_points = np.float32(entity_data[EntityType.BOUNDARY])
-            src_pts = order_points(boundary_points)
-        else:
-            # Fallback to default boundary points
-            src_pts = order_points(np.float32([[0, 0], [self.width, 0], [self.width, self.height], [0, self.height]]))
+            # Categorize entities
+            entity_data = categorize_entity(entity_pos)
 
-        # Smoothing with a fixed-size queue
-        self.src_history.append(src_pts)
-        smoothed_src_pts = np.mean(self.src_history, axis=0)
+        with self.profiler.stage("homography"):
+            # Check if we have enough boundary points
+            if len(entity_data[EntityType.BOUNDARY]) >= 4:
+                # Extract and order boundary points
+                boundary_points = np.float32(entity_data[EntityType.BOUNDARY])
+                src_pts = order_points(boundary_points)
+            else:
+                src_pts = None
 
-        # Define destination points
-        dst_pts = order_points(np.float32([[0, 0], [self.width, 0], [self.width, self.height], [0, self.height]]))
+            # Incremental smoothing, frozen once the boundary is locked
+            smoothed_src_pts = self.calibrator.update(src_pts)
+            if smoothed_src_pts is None:
+                # Fallback to default boundary points until the boundary has been seen
+                smoothed_src_pts = order_points(np.float32([[0, 0], [self.width, 0], [self.width, self.height], [0, self.height]]))
+            elif len(entity_data[EntityType.BOUNDARY]) == 0:
+                # Report the calibrated corners when the boundary was not detected this frame
+                entity_data[EntityType.BOUNDARY] = smoothed_src_pts
 
-        # Calculate the perspective transform matrix
-        M = cv2.getPerspectiveTransform(smoothed_src_pts, dst_pts)
+            # Calculate the perspective transform matrix
+            M = self.get_homography(smoothed_src_pts)
 
         # Update the response model
-        transformed_data = process_entity_data(entity_data, M)
-        self.response_model = map_to_response(transformed_data)
+        with self.profiler.stage("transform"):
+            transformed_data = process_entity_data_batched(entity_data, M)
+        with self.profiler.stage("pose_filter"):
+            velocities = self.apply_pose_filter(transformed_data, timestamp)
+        with self.profiler.stage("response"):
+            self.response_model = map_to_response(transformed_data, velocities, timestamp)
 
         return M
 
+    def apply_pose_filter(self, entity_data, timestamp):
+        """Replace player and object poses with filtered ones, returns their velocities by entity."""
+        velocities = {}
+        if self.pose_filter is None or timestamp is None:
+            return velocities
+
+        for entity_type in [EntityType.PLAYER, EntityType.OBJECT]:
+            filtered = []
+            for entity, pos in entity_data[entity_type]:
+                pos, velocities[entity] = self.pose_filter.update(entity, pos, timestamp, self.pose_lead_time)
+                filtered.append((entity, pos))
+            entity_data[entity_type] = filtered
+
+        return velocities
+
+    def get_homography(self, src_pts):
+        """Return the cached perspective transform unless the corners moved beyond the tolerance."""
+        src_pts = np.float32(src_pts)
+        if (self.homography is None
+                or np.max(np.abs(src_pts - self.homography_src)) > self.homography_tolerance):
+            self.homography = cv2.getPerspectiveTransform(src_pts, self.dst_pts)
+            self.homography_src = src_pts
+        return self.homography
+
+    def handle_frame(self, frame, timestamp=None):
+        """Process, render and hand off one frame. Returns False when the user asked to quit."""
+        try:
+            # Process the frame and get the transformation matrix
+            current_M = self.process_frame(frame, timestamp)
+
+            if self.preview:
+                with self.profiler.stage("render"):
+                    self.preview.submit(frame, current_M, self.response_model)
+
+            if self.headless:
+                with self.profiler.stage("publish"):
+                    self.manager.process_frame(self.response_model, None)
+                return True
+
+            # Apply the transformation and display the result
+            if current_M is not None:
+                with self.profiler.stage("render"):
+                    warped_img = cv2.warpPerspective(frame, current_M, (self.width, self.height))
+                    warped_img = draw_circles(warped_img, self.response_model)
+                with self.profiler.stage("publish"):
+                    self.manager.process_frame(self.response_model, warped_img)
+                with self.profiler.stage("render"):
+                    cv2.imshow("Frame", warped_img)
+            else:
+                with self.profiler.stage("render"):
+                    cv2.imshow("Frame", frame)
+        except Exception as e:
+            print(f"Error: {e}")
+
+        # Break the loop if 'q' is pressed
+        with self.profiler.stage("render"):
+            return cv2.waitKey(1) != ord("q")
+
     def run(self):
         """Run the vision pipeline in a loop."""
         if not self.cam:
             self.init_camera()
             print("Camera initialized.")
 
-        while self.manager.running:
-            print("Processing frame...")
-            ret, frame = self.cam.read()
-            if not ret:
-                break
+        if self.preview:
+            self.preview.start()
 
-            try:
-                # Process the frame and get the transformation matrix
-                current_M = self.process_frame(frame)
+        if self.pipelined:
+            self.run_pipelined()
+        else:
+            while self.manager.running:
+                self.profiler.begin_frame()
+                with self.profiler.stage("capture"):
+                    ret, frame = self.cam.read()
+                timestamp = self.cam.timestamp
+                if not ret:
+                    break
 
-                # Apply the transformation and display the result
-                if current_M is not None:
-                    warped_img = cv2.warpPerspective(frame, current_M, (self.width, self.height))
-                    warped_img = draw_circles(warped_img, self.response_model)
-                    self.manager.process_frame(current_M, warped_img)
-                    cv2.imshow("Frame", warped_img)
-                else:
-                    cv2.imshow("Frame", frame)
-            except Exception as e:
-                print(f"Error: {e}")
+                keep_running = self.handle_frame(frame, timestamp)
+                self.profiler.end_frame()
+                if not keep_running:
+                    break
 
-            # Break the loop if 'q' is pressed
-            if cv2.waitKey(1) == ord("q"):
-                break
+        if self.preview:
+            self.preview.stop()
+        if self.workers:
+            self.workers.stop()
 
         self.cam.release()
-        cv2.destroyAllWindows()
+        if not self.headless:
+            cv2.destroyAllWindows()
+
+    def run_pipelined(self):
+        """Capture on a dedicated thread and always process the newest frame."""
+        # Keep the driver queue short so the grabber never reads stale frames
+        self.cam.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        self.frame_slot = LatestFrameSlot()
+        self.grabber = FrameGrabber(self.cam, self.frame_slot)
+        self.grabber.start()
+
+        try:
+            while self.manager.running and self.grabber.running:
+                item = self.frame_slot.get(timeout=0.5)
+                if item is None:
+                    continue
+
+                seq, timestamp, frame = item
+                if self.max_frame_age and time.time() - timestamp > self.max_frame_age:
+                    self.stale_dropped += 1
+                    continue
+
+                self.frames_processed += 1
+                # Capture runs on the grabber thread, count its read time toward this frame
+                self.profiler.begin_frame()
+                self.profiler.add("capture", self.grabber.read_time)
+                keep_running = self.handle_frame(frame, timestamp)
+                self.profiler.end_frame()
+                if not keep_running:
+                    break
+        finally:
+            self.grabber.stop()
+            self.grabber.join(1)
+            print(f"Vision pipeline stats: {self.get_pipeline_stats()}")
+
+    def get_pipeline_stats(self):
+        """Frame counts and drops for each stage of the pipelined mode."""
+        if not self.grabber:
+            return {}
+        return {
+            "captured": self.grabber.frames_read,
+            "processed": self.frames_processed,
+            "capture_dropped": self.frame_slot.dropped,  # Overwritten before processing picked them up
+            "process_dropped": self.stale_dropped,  # Older than max_frame_age when picked up
+        }
+
+    def get_profile_stats(self):
+        """Rolling per-stage timings in seconds plus the frame rate, see VisionProfiler."""
+        return dict(self.profiler.get_stats(), fps=self.profiler.fps())
 
     def get_response_model(self):
         """Get the latest response model."""
@@ -0,0 +1,202 @@
+import numpy as np
+from collections import defaultdict
+from camera.utils import padded_window, merge_windows
+
+
+def min_cost_assignment(cost):
+    """
+    Minimum-cost assignment for a rectangular cost matrix (Hungarian method).
+
+    Returns a list of (row, col) pairs, one for every row when there are at
+    least as many columns as rows, otherwise one for every column.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+    if n == 0:
+        return []
+
+    # Shortest augmenting path formulation with row/column potentials, 1-indexed
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    p = [0] * (m + 1)
+    way = [0] * (m + 1)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [np.inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            delta = np.inf
+            j1 = 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = cost[i0 - 1, j - 1] - u[i0] - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while True:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+            if j0 == 0:
+                break
+
+    pairs = [(p[j] - 1, j - 1) for j in range(1, m + 1) if p[j] != 0]
+    if transposed:
+        pairs = [(col, row) for row, col in pairs]
+    return sorted(pairs)
+
+
+class Track:
+    """Per-entity state carried between frames."""
+    def __init__(self, center, size, frame):
+        self.center = center
+        self.velocity = np.zeros(2)  # Pixels per frame
+        self.size = size
+        self.last_frame = frame
+        self.missed = 0
+
+    def predict(self, frame):
+        return self.center + self.velocity * (frame - self.last_frame)
+
+    def update(self, center, size, frame, alpha=0.5):
+        elapsed = max(frame - self.last_frame, 1)
+        self.velocity = alpha * (center - self.center) / elapsed + (1 - alpha) * self.velocity
+        self.center = center
+        self.size = size
+        self.last_frame = frame
+        self.missed = 0
+
+
+class EntityTracker:
+    """
+    Keeps identities stable by matching detections to predicted entity positions.
+
+    Entities that look identical (same shape and color, or same ArUco id) are
+    matched to detections by minimum total distance between each entity's
+    predicted center and the detection centers. Matches farther than
+    `max_distance` pixels are rejected, and a track is forgotten after
+    `max_missed` frames without a match.
+    """
+    def __init__(self, max_distance=150, max_missed=10, search_margin=40, full_search_interval=30):
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.search_margin = search_margin
+        self.full_search_interval = full_search_interval
+
+        self.tracks = {}  # ArenaEntity -> Track
+        self.frame = 0
+        self.frames_since_full_search = 0
+
+    def begin_frame(self):
+        self.frame += 1
+
+    def assign_color(self, entities, shape_color_points):
+        """Tracked replacement for assign_positions_to_color_entities."""
+        return self._assign(entities, shape_color_points, lambda entity: (entity.shape, entity.color))
+
+    def assign_aruco(self, entities, list_of_aruco):
+        """Tracked replacement for assign_positions_to_aruco_entities."""
+        return self._assign(entities, list_of_aruco, lambda entity: entity.aruco_id)
+
+    def _assign(self, entities, detections, key):
+        grouped_entities = defaultdict(list)
+        for entity in entities:
+            grouped_entities[key(entity)].append(entity)
+
+        positions_dict = defaultdict(list)
+        for detection_key, points in detections:
+            positions_dict[detection_key].append(points)
+
+        result = []
+        for group_key, entities_group in grouped_entities.items():
+            positions = positions_dict.get(group_key, [])
+            centers = [np.mean(np.asarray(points, dtype=np.float64), axis=0) for points in positions]
+
+            matched = set()
+            if centers:
+                cost = np.array([self._costs(entity, centers) for entity in entities_group])
+                for row, col in min_cost_assignment(cost):
+                    if cost[row, col] > self.max_distance:
+                        continue
+                    entity, points = entities_group[row], positions[col]
+                    self._update_track(entity, centers[col], points)
+                    result.append((entity, points))
+                    matched.add(row)
+
+            for row, entity in enumerate(entities_group):
+                if row not in matched:
+                    self._miss(entity)
+
+        return result
+
+    def _costs(self, entity, centers):
+        track = self.tracks.get(entity)
+        if track is None:
+            # Untracked entities can take any detection at the largest allowed cost
+            return [self.max_distance] * len(centers)
+        predicted = track.predict(self.frame)
+        return [np.linalg.norm(center - predicted) for center in centers]
+
+    def _update_track(self, entity, center, points):
+        size = float(np.ptp(np.asarray(points, dtype=np.float64), axis=0).max())
+        track = self.tracks.get(entity)
+        if track is None:
+            self.tracks[entity] = Track(center, size, self.frame)
+        else:
+            track.update(center, size, self.frame)
+
+    def _miss(self, entity):
+        track = self.tracks.get(entity)
+        if track is None:
+            return
+        track.missed += 1
+        if track.missed > self.max_missed:
+            del self.tracks[entity]
+
+    def search_region(self, entity, width, height):
+        """Predicted [x0, y0, x1, y1] window for an entity, or None if it is not tracked."""
+        track = self.tracks.get(entity)
+        if track is None:
+            return None
+        predicted = track.predict(self.frame)
+        # Grow the window with the object size, its speed and how long it has been missing
+        pad = self.search_margin + track.size / 2 + np.linalg.norm(track.velocity) * (track.missed + 1)
+        return padded_window([predicted], pad, width, height)
+
+    def search_regions(self, entities, width, height):
+        """
+        Merged search windows covering every entity in `entities`, or None when
+        the whole frame should be searched (an entity is untracked or lost, or
+        a periodic full search is due).
+        """
+        self.frames_since_full_search += 1
+        if self.frames_since_full_search >= self.full_search_interval:
+            self.frames_since_full_search = 0
+            return None
+
+        windows = []
+        for entity in entities:
+            track = self.tracks.get(entity)
+            if track is None or track.missed > 0:
+                self.frames_since_full_search = 0
+                return None
+            windows.append(self.search_region(entity, width, height))
+        return merge_windows(windows)
@@ -0,0 +1,63 @@
+import threading
+import time
+
+
+class LatestFrameSlot:
+    """
+    Single-slot frame buffer where the newest frame always wins.
+
+    Putting a frame replaces whatever is in the slot; a replaced frame that
+    was never taken is counted as dropped.
+    """
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.frame = None
+        self.seq = 0
+        self.timestamp = None
+        self.taken_seq = 0
+        self.dropped = 0
+
+    def put(self, frame, timestamp):
+        with self.condition:
+            if self.seq > self.taken_seq:
+                self.dropped += 1
+            self.seq += 1
+            self.frame = frame
+            self.timestamp = timestamp
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """Wait for a frame newer than the last one taken, returns (seq, timestamp, frame) or None."""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.seq > self.taken_seq, timeout):
+                return None
+            self.taken_seq = self.seq
+            frame, self.frame = self.frame, None
+            return self.seq, self.timestamp, frame
+
+
+class FrameGrabber(threading.Thread):
+    """Reads frames from the camera as fast as it delivers them into a LatestFrameSlot."""
+    def __init__(self, cam, slot):
+        super().__init__(daemon=True)
+        self.cam = cam
+        self.slot = slot
+        self.running = True
+        self.frames_read = 0
+        self.failed_reads = 0
+        self.read_time = 0.0  # Seconds the latest cam.read() took
+
+    def run(self):
+        while self.running:
+            start = time.perf_counter()
+            ret, frame = self.cam.read()
+            self.read_time = time.perf_counter() - start
+            if not ret:
+                self.failed_reads += 1
+                break
+            self.frames_read += 1
+            self.slot.put(frame, self.cam.timestamp)  # Wall clock so the capture time can be sent to players
+        self.running = False
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,242 @@
+"""
+Frame sources for the vision pipeline.
+
+Every source works like cv2.VideoCapture (read, set, release) and also
+exposes `timestamp`, the wall-clock capture time of the frame last read.
+Replay sources keep the spacing of the recorded timestamps, either as fast
+as frames can be consumed or paced in real time, and shift them so the
+first replayed frame is stamped with the time replay started.
+"""
+import csv
+import glob
+from abc import ABC, abstractmethod
+import os
+import sys
+import time
+
+import cv2
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+def timestamps_path(path):
+    """Sidecar file holding the capture time of every frame of a recording."""
+    if os.path.isdir(path):
+        return os.path.join(path, "timestamps.csv")
+    return os.path.splitext(path)[0] + "_timestamps.csv"
+
+
+def read_timestamps(path):
+    sidecar = timestamps_path(path)
+    if not os.path.exists(sidecar):
+        return None
+    with open(sidecar, newline="") as file:
+        return [float(row[1]) for row in csv.reader(file) if row and row[0] != "frame"]
+
+
+class FrameSource(ABC):
+    def __init__(self):
+        self.timestamp = None
+
+    @abstractmethod
+    def read(self):
+        """Returns (ok, frame) like cv2.VideoCapture.read."""
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        pass
+
+
+class CameraSource(FrameSource):
+    """A live camera, stamped with the wall-clock time each read returns."""
+    def __init__(self, index=0, width=None, height=None, backend=None):
+        super().__init__()
+        if backend is None:
+            # DirectShow opens much faster on Windows, other platforms use their default backend
+            backend = cv2.CAP_DSHOW if sys.platform == "win32" else cv2.CAP_ANY
+        self.cap = cv2.VideoCapture(index, backend)
+        if width:
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        if height:
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+    def read(self):
+        ret, frame = self.cap.read()
+        self.timestamp = time.time()
+        return ret, frame
+
+    def set(self, prop, value):
+        return self.cap.set(prop, value)
+
+    def release(self):
+        self.cap.release()
+
+
+class ReplaySource(FrameSource):
+    """
+    Base for recorded sources. With `paced` each frame is returned no earlier
+    than its original offset from the first frame; otherwise frames are
+    returned as fast as they are read. Recordings without timestamps are
+    assumed to be `fps` frames per second.
+    """
+    def __init__(self, timestamps=None, fps=30.0, paced=False, loop=False):
+        super().__init__()
+        self.recorded = timestamps
+        self.fps = fps
+        self.paced = paced
+        self.loop = loop
+        self.index = 0
+        self.start = None
+        self.offset = 0.0  # Recording time added by earlier loops
+
+    def recorded_offset(self, index):
+        if self.recorded and index < len(self.recorded):
+            return self.recorded[index] - self.recorded[0]
+        return index / self.fps
+
+    def frame_interval(self, count):
+        """Mean recorded spacing of the first `count` frames, the gap left between two loops."""
+        if self.recorded and count > 1:
+            return self.recorded_offset(count - 1) / (count - 1)
+        return 1.0 / self.fps
+
+    @abstractmethod
+    def next_frame(self):
+        """Returns the next recorded frame or None at the end."""
+
+    @abstractmethod
+    def rewind(self):
+        """Go back to the first recorded frame."""
+
+    def read(self):
+        frame = self.next_frame()
+        if frame is None and self.loop and self.index > 0:
+            self.offset += self.recorded_offset(self.index - 1) + self.frame_interval(self.index)
+            self.index = 0
+            self.rewind()
+            frame = self.next_frame()
+        if frame is None:
+            return False, None
+
+        if self.start is None:
+            self.start = time.time()
+        self.timestamp = self.start + self.offset + self.recorded_offset(self.index)
+        self.index += 1
+
+        if self.paced:
+            delay = self.timestamp - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        return True, frame
+
+
+class VideoFileSource(ReplaySource):
+    """A recorded video, with per-frame timestamps from its sidecar file if it has one."""
+    def __init__(self, path, paced=False, loop=False):
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise IOError(f"Cannot open video {path}")
+        fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        super().__init__(read_timestamps(path), fps, paced, loop)
+
+    def next_frame(self):
+        ret, frame = self.cap.read()
+        return frame if ret else None
+
+    def rewind(self):
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageSequenceSource(ReplaySource):
+    """A directory of images replayed in file name order."""
+    def __init__(self, directory, fps=30.0, paced=False, loop=False):
+        self.files = sorted(path for path in glob.glob(os.path.join(directory, "*"))
+                            if path.lower().endswith(IMAGE_EXTENSIONS))
+        if not self.files:
+            raise IOError(f"No images in {directory}")
+        super().__init__(read_timestamps(directory), fps, paced, loop)
+        self.position = 0
+
+    def next_frame(self):
+        if self.position >= len(self.files):
+            return None
+        frame = cv2.imread(self.files[self.position])
+        self.position += 1
+        return frame
+
+    def rewind(self):
+        self.position = 0
+
+
+def open_frame_source(spec=0, width=None, height=None, paced=False, loop=False):
+    """A camera index, a video file or a directory of images, as a FrameSource."""
+    if isinstance(spec, FrameSource):
+        return spec
+    if isinstance(spec, int) or (isinstance(spec, str) and spec.isdigit()):
+        return CameraSource(int(spec), width, height)
+    if os.path.isdir(spec):
+        return ImageSequenceSource(spec, paced=paced, loop=loop)
+    return VideoFileSource(spec, paced=paced, loop=loop)
+
+
+class FrameRecorder:
+    """
+    Saves frames with their capture timestamps so they can be replayed with
+    the sources above. A path ending in a video extension is written with
+    cv2.VideoWriter; anything else is a directory of numbered PNG images.
+    """
+    def __init__(self, path, fps=30.0, codec="MJPG"):
+        self.path = path
+        self.fps = fps
+        self.codec = codec
+        self.writer = None
+        self.is_video = os.path.splitext(path)[1].lower() in (".avi", ".mp4", ".mkv", ".mov")
+        if not self.is_video:
+            os.makedirs(path, exist_ok=True)
+        self.timestamps_file = open(timestamps_path(path), "w", newline="")
+        self.timestamps = csv.writer(self.timestamps_file)
+        self.timestamps.writerow(["frame", "timestamp"])
+        self.frames = 0
+
+    def write(self, frame, timestamp=None):
+        if self.is_video:
+            if self.writer is None:
+                height, width = frame.shape[:2]
+                self.writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.codec), self.fps, (width, height))
+            self.writer.write(frame)
+        else:
+            cv2.imwrite(os.path.join(self.path, f"{self.frames:06d}.png"), frame)
+        self.timestamps.writerow([self.frames, repr(time.time() if timestamp is None else timestamp)])
+        self.frames += 1
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+        self.timestamps_file.close()
+
+
+class RecordingSource(FrameSource):
+    """Passes frames through from another source while recording them."""
+    def __init__(self, source, recorder):
+        super().__init__()
+        self.source = source
+        self.recorder = recorder
+
+    def read(self):
+        ret, frame = self.source.read()
+        self.timestamp = self.source.timestamp
+        if ret:
+            self.recorder.write(frame, self.timestamp)
+        return ret, frame
+
+    def set(self, prop, value):
+        return self.source.set(prop, value)
+
+    def release(self):
+        self.source.release()
+        self.recorder.close()
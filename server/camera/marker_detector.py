@@ -0,0 +1,82 @@
+import numpy as np
+import cv2
+from camera.utils import create_aruco_detector, detect_aruco_markers, padded_window, merge_windows
+
+
+class MarkerDetector:
+    """
+    Persistent ArUco detector that tracks markers between frames.
+
+    The dictionary, parameters and detector are built once. When markers were
+    found in the previous frame only padded windows around their last known
+    corners are searched. A full-frame scan is done every `full_scan_interval`
+    frames, when there is nothing to track, or when a tracked marker is lost.
+    """
+    def __init__(self, dictionary=cv2.aruco.DICT_5X5_50, padding=40, full_scan_interval=30, roi_tracking=True,
+                 pyramid_scale=None):
+        self.detector = create_aruco_detector(dictionary)
+        self.padding = padding
+        self.full_scan_interval = full_scan_interval
+        self.roi_tracking = roi_tracking
+        self.pyramid_scale = pyramid_scale  # Coarse-to-fine search on full scans when set
+        self.ignore_ids = set()  # Marker ids dropped from results and not tracked
+
+        self.last_markers = []  # [(aruco_id, corners), ...] from the previous frame
+        self.frames_since_full_scan = 0
+        self.full_scans = 0
+        self.roi_scans = 0
+
+    def reset(self):
+        """Forget tracked markers so the next frame does a full scan."""
+        self.last_markers = []
+        self.frames_since_full_scan = 0
+
+    def detect(self, image, full_scan=False):
+        """Detect markers, returning the same format as detect_aruco_markers. `full_scan` skips tracking."""
+        if (full_scan
+                or not self.roi_tracking
+                or not self.last_markers
+                or self.frames_since_full_scan >= self.full_scan_interval):
+            return self._full_scan(image)
+
+        markers = self._roi_scan(image)
+
+        # A tracked marker went missing, search the whole frame again
+        if len(markers) < len(self.last_markers):
+            return self._full_scan(image)
+
+        self.frames_since_full_scan += 1
+        self.roi_scans += 1
+        self.last_markers = markers
+        return markers
+
+    def _full_scan(self, image):
+        markers = self._filter(detect_aruco_markers(image, self.detector, self.pyramid_scale))
+        self.frames_since_full_scan = 0
+        self.full_scans += 1
+        self.last_markers = markers
+        return markers
+
+    def _roi_scan(self, image):
+        height, width = image.shape[:2]
+        markers = []
+        for x0, y0, x1, y1 in self._search_windows(width, height):
+            for aruco_id, corners in detect_aruco_markers(image[y0:y1, x0:x1], self.detector):
+                markers.append((aruco_id, corners + np.float32([x0, y0])))
+        return self._filter(markers)
+
+    def _filter(self, markers):
+        if not self.ignore_ids:
+            return markers
+        return [(aruco_id, corners) for aruco_id, corners in markers if aruco_id not in self.ignore_ids]
+
+    def _search_windows(self, width, height):
+        """Padded bounding boxes around the last corners, merged where they overlap."""
+        windows = []
+        for _, corners in self.last_markers:
+            # Pad by a fixed margin plus half the marker size to allow for motion
+            pad = self.padding + 0.5 * np.ptp(corners, axis=0).max()
+            windows.append(padded_window(corners, pad, width, height))
+
+        # Merge overlapping windows so a marker is never detected twice
+        return merge_windows(windows)
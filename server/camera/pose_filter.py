@@ -0,0 +1,90 @@
+import numpy as np
+
+
+def wrap_angle(angle):
+    """Wrap an angle to [-pi, pi)."""
+    return (angle + np.pi) % (2 * np.pi) - np.pi
+
+
+class PoseKalmanFilter:
+    """
+    Constant-velocity Kalman filter over a planar pose (x, y, yaw).
+
+    The state is [x, y, yaw, vx, vy, vyaw] in pixels, radians and seconds.
+    Process noise follows a white-noise acceleration model with standard
+    deviations `accel_std` (px/s^2) and `yaw_accel_std` (rad/s^2).
+    """
+    def __init__(self, pose, timestamp, position_std=2.0, yaw_std=0.05, accel_std=800.0, yaw_accel_std=20.0):
+        self.x = np.zeros(6)
+        self.x[:3] = pose
+        self.P = np.diag([position_std ** 2, position_std ** 2, yaw_std ** 2, 1e4, 1e4, 10.0])
+        self.R = np.diag([position_std ** 2, position_std ** 2, yaw_std ** 2])
+        self.accel_var = np.array([accel_std ** 2, accel_std ** 2, yaw_accel_std ** 2])
+        self.H = np.hstack([np.eye(3), np.zeros((3, 3))])
+        self.timestamp = timestamp
+
+    def predict(self, timestamp):
+        dt = timestamp - self.timestamp
+        if dt <= 0:
+            return
+        F = np.eye(6)
+        F[:3, 3:] = np.eye(3) * dt
+        Q = np.zeros((6, 6))
+        Q[:3, :3] = np.diag(self.accel_var * dt ** 4 / 4)
+        Q[:3, 3:] = Q[3:, :3] = np.diag(self.accel_var * dt ** 3 / 2)
+        Q[3:, 3:] = np.diag(self.accel_var * dt ** 2)
+
+        self.x = F @ self.x
+        self.x[2] = wrap_angle(self.x[2])
+        self.P = F @ self.P @ F.T + Q
+        self.timestamp = timestamp
+
+    def update(self, pose, timestamp):
+        """Fold in a measured (x, y, yaw) taken at `timestamp`."""
+        self.predict(timestamp)
+        innovation = np.asarray(pose, dtype=np.float64) - self.H @ self.x
+        innovation[2] = wrap_angle(innovation[2])
+
+        S = self.H @ self.P @ self.H.T + self.R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ innovation
+        self.x[2] = wrap_angle(self.x[2])
+        self.P = (np.eye(6) - K @ self.H) @ self.P
+
+    def state_at(self, timestamp):
+        """(x, y, yaw), (vx, vy, vyaw) extrapolated to `timestamp` without changing the filter."""
+        dt = max(timestamp - self.timestamp, 0.0)
+        position = self.x[:3] + self.x[3:] * dt
+        position[2] = wrap_angle(position[2])
+        return position, self.x[3:].copy()
+
+
+class PoseFilterBank:
+    """
+    One PoseKalmanFilter per entity, fed with the 6-dof poses from get_6dof_pos.
+
+    Filters not updated for `max_age` seconds are restarted from the next
+    measurement instead of being extrapolated across the gap.
+    """
+    def __init__(self, max_age=0.5, **filter_params):
+        self.max_age = max_age
+        self.filter_params = filter_params
+        self.filters = {}
+
+    def update(self, entity, pose, timestamp, lead_time=0.0):
+        """
+        Filter a (x, y, z, roll, pitch, yaw) pose measured at `timestamp`.
+
+        Returns the filtered pose and velocity in the same 6-dof layout, with
+        the pose extrapolated `lead_time` seconds ahead of the capture time.
+        """
+        measurement = (pose[0], pose[1], pose[5])
+        kalman = self.filters.get(entity)
+        if kalman is None or timestamp - kalman.timestamp > self.max_age:
+            kalman = PoseKalmanFilter(measurement, timestamp, **self.filter_params)
+            self.filters[entity] = kalman
+        else:
+            kalman.update(measurement, timestamp)
+
+        (x, y, yaw), (vx, vy, vyaw) = kalman.state_at(timestamp + lead_time)
+        return np.array((x, y, 0, 0, 0, yaw)), np.array((vx, vy, 0, 0, 0, vyaw))
@@ -0,0 +1,157 @@
+import threading
+import time
+import cv2
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from camera.utils import draw_circles
+from camera.frame_pipeline import LatestFrameSlot
+
+BOUNDARY = "frame"
+
+
+class PreviewServer:
+    """
+    MJPEG preview of the annotated arena, served over HTTP off the vision hot path.
+
+    The vision loop only hands over references with submit(). Warping, drawing
+    and JPEG encoding happen on the encoder thread, at most `max_fps` times a
+    second, on the newest submitted frame; anything older is skipped. Nothing
+    is rendered while no one is watching.
+    """
+    def __init__(self, width, height, host="127.0.0.1", port=8090, max_fps=10, jpeg_quality=70):
+        self.width = width
+        self.height = height
+        self.host = host
+        self.port = port
+        self.max_fps = max_fps
+        self.jpeg_quality = jpeg_quality
+
+        self.running = False
+        self.viewers = 0
+        self.frame_slot = LatestFrameSlot()
+        self.jpeg_condition = threading.Condition()
+        self.jpeg = None
+        self.jpeg_seq = 0
+        self.frames_encoded = 0
+
+        self.http_server = None
+        self.threads = []
+
+    def start(self):
+        """Start the HTTP server and the encoder on their own threads."""
+        preview = self
+
+        class Handler(PreviewRequestHandler):
+            server_preview = preview
+
+        self.http_server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.http_server.daemon_threads = True
+        self.running = True
+        self.threads = [
+            threading.Thread(target=self.http_server.serve_forever, daemon=True),
+            threading.Thread(target=self.encode_loop, daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+        print(f"Preview server streaming on http://{self.host}:{self.port}/")
+
+    def stop(self):
+        self.running = False
+        if self.http_server:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+        with self.jpeg_condition:
+            self.jpeg_condition.notify_all()
+        for thread in self.threads:
+            thread.join(1)
+
+    def submit(self, frame, M, response):
+        """Offer the latest frame for preview. Cheap enough to call every frame."""
+        if self.viewers > 0:
+            self.frame_slot.put((frame, M, response), time.monotonic())
+
+    def render(self, frame, M, response):
+        """Warp the raw frame to arena coordinates and draw detected entities."""
+        if M is None:
+            return frame
+        warped_img = cv2.warpPerspective(frame, M, (self.width, self.height))
+        return draw_circles(warped_img, response)
+
+    def encode_loop(self):
+        min_interval = 1.0 / self.max_fps
+        while self.running:
+            item = self.frame_slot.get(timeout=0.5)
+            if item is None:
+                continue
+
+            started = time.monotonic()
+            _, _, (frame, M, response) = item
+            try:
+                ok, buffer = cv2.imencode(".jpg", self.render(frame, M, response),
+                                          [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            except Exception as e:
+                print(f"Preview error: {e}")
+                continue
+
+            if ok:
+                with self.jpeg_condition:
+                    self.jpeg = buffer.tobytes()
+                    self.jpeg_seq += 1
+                    self.frames_encoded += 1
+                    self.jpeg_condition.notify_all()
+
+            # Cap the encode rate, frames submitted meanwhile are skipped
+            time.sleep(max(0.0, min_interval - (time.monotonic() - started)))
+
+    def wait_for_jpeg(self, last_seq, timeout=1.0):
+        """Block until a JPEG newer than `last_seq` is available, returns (seq, jpeg)."""
+        with self.jpeg_condition:
+            self.jpeg_condition.wait_for(lambda: self.jpeg_seq > last_seq or not self.running, timeout)
+            return self.jpeg_seq, self.jpeg
+
+    def get_stats(self):
+        return {
+            "viewers": self.viewers,
+            "encoded": self.frames_encoded,
+            "skipped": self.frame_slot.dropped,
+        }
+
+
+class PreviewRequestHandler(BaseHTTPRequestHandler):
+    """Streams the preview as multipart/x-mixed-replace JPEG parts."""
+    server_preview = None
+
+    def do_GET(self):
+        if self.path not in ("/", "/stream.mjpg"):
+            self.send_error(404)
+            return
+
+        preview = self.server_preview
+        self.send_response(200)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+        self.end_headers()
+
+        with preview.jpeg_condition:
+            preview.viewers += 1
+        last_seq = 0
+        try:
+            while preview.running:
+                seq, jpeg = preview.wait_for_jpeg(last_seq)
+                if seq == last_seq or jpeg is None:
+                    continue
+                last_seq = seq
+
+                self.wfile.write(f"--{BOUNDARY}\r\n".encode())
+                self.wfile.write(b"Content-Type: image/jpeg\r\n")
+                self.wfile.write(f"Content-Length: {len(jpeg)}\r\n\r\n".encode())
+                self.wfile.write(jpeg)
+                self.wfile.write(b"\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with preview.jpeg_condition:
+                preview.viewers -= 1
+
+    def log_message(self, format, *args):
+        # Keep the server console quiet, one line per request is too noisy
+        pass
@@ -4,39 +4,38 @@ from enum import Enum
 from shapely.geometry import MultiPoint, Polygon
 from camera.color_ranges import COLOR_RANGES
 from camera.arena_entity import *
+from camera.vision_profiler import profiler
 
 
-def detect_shapes_and_colors(image):
+def classify_shape(contour):
+    """Approximate a contour and name its shape from the number of vertices."""
+    epsilon = 0.02 * cv2.arcLength(contour, True)
+    approx = cv2.approxPolyDP(contour, epsilon, True)
+    shape = "unknown"
 
-    detected_shapes = []
-    hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    # Identify shape based on the number of vertices
+    num_vertices = len(approx)
+    if num_vertices > 7:
+        shape = "circle"
+    elif num_vertices == 3:
+        shape = "triangle"
+    elif num_vertices == 4:
+         shape = "rectangle"
+    elif num_vertices == 2:
+        shape = "line"
 
-    for color_name, ranges in COLOR_RANGES.items():
-        # Create a combined mask for the color
-        mask = np.zeros(image.shape[:2], dtype=np.uint8)
-        for lower, upper in ranges:
-            mask = cv2.bitwise_or(mask, cv2.inRange(hsv_image, lower, upper))
+    return shape, approx
 
-        # Find contours for the color
+
+def extract_shapes(mask, color_name, min_area=100):
+    """Find the external contours of a binary mask and classify each blob."""
+    detected_shapes = []
+    with profiler.stage("contours"):
         contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
         for contour in contours:
-            if cv2.contourArea(contour) > 100:  # Filter small contours
-                # Approximate the contour to detect shapes
-                epsilon = 0.02 * cv2.arcLength(contour, True)
-                approx = cv2.approxPolyDP(contour, epsilon, True)
-                shape = "unknown"
-
-                # Identify shape based on the number of vertices
-                num_vertices = len(approx)
-                if num_vertices > 7:
-                    shape = "circle"
-                elif num_vertices == 3:
-                    shape = "triangle"
-                elif num_vertices == 4:
-                     shape = "rectangle"
-                elif num_vertices == 2:
-                    shape = "line"
+            if cv2.contourArea(contour) > min_area:  # Filter small contours
+                shape, approx = classify_shape(contour)
 
                 # Get points for the detected shape
                 points = [tuple(point[0]) for point in approx]
@@ -45,13 +44,131 @@ def detect_shapes_and_colors(image):
     return detected_shapes
 
 
+def color_mask(hsv_image, color_name, color_lut=None):
+    """Binary mask of the pixels of one palette color."""
+    with profiler.stage(f"mask:{color_name}"):
+        if color_lut is not None:
+            return color_lut.mask(color_lut.classify(hsv_image), color_name)
+
+        # Create a combined mask for the color
+        mask = np.zeros(hsv_image.shape[:2], dtype=np.uint8)
+        for lower, upper in COLOR_RANGES[color_name]:
+            mask = cv2.bitwise_or(mask, cv2.inRange(hsv_image, lower, upper))
+        return mask
+
+
+def detect_shapes_and_colors(image, color_lut=None, pyramid_scale=None, min_area=100, regions=None):
+
+    if regions is not None:
+        return detect_shapes_and_colors_in_regions(image, regions, color_lut, pyramid_scale, min_area)
+    if pyramid_scale:
+        return detect_shapes_and_colors_pyramid(image, pyramid_scale, color_lut, min_area=min_area)
+    if color_lut is not None:
+        return detect_shapes_and_colors_lut(image, color_lut, min_area)
+
+    detected_shapes = []
+    with profiler.stage("hsv"):
+        hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+
+    for color_name in COLOR_RANGES:
+        mask = color_mask(hsv_image, color_name)
+
+        # Find contours for the color
+        detected_shapes.extend(extract_shapes(mask, color_name, min_area))
+
+    return detected_shapes
+
+
+def detect_shapes_and_colors_in_regions(image, regions, color_lut=None, pyramid_scale=None, min_area=100):
+    """Run detect_shapes_and_colors only inside the given [x0, y0, x1, y1] windows."""
+    detected_shapes = []
+    for x0, y0, x1, y1 in regions:
+        for shape_color, points in detect_shapes_and_colors(image[y0:y1, x0:x1], color_lut, pyramid_scale, min_area):
+            detected_shapes.append((shape_color, [(x + x0, y + y0) for x, y in points]))
+    return detected_shapes
+
 
+class ColorLUT:
+    """
+    HSV -> color bitmask lookup table compiled from a color range palette.
+
+    Bit i of an entry is set when the HSV value falls in the ranges of
+    ``names[i]``, so pixels where ranges overlap (blue and purple share hues
+    125-130) belong to every matching color, as with per-color inRange masks.
+    """
+    def __init__(self, color_ranges=COLOR_RANGES):
+        if len(color_ranges) > 16:
+            raise ValueError("ColorLUT supports at most 16 colors")
+
+        self.names = list(color_ranges.keys())
+        dtype = np.uint8 if len(self.names) <= 8 else np.uint16
+        self.table = np.zeros((180, 256, 256), dtype=dtype)
+        for i, name in enumerate(self.names):
+            for lower, upper in color_ranges[name]:
+                self.table[lower[0]:upper[0] + 1, lower[1]:upper[1] + 1, lower[2]:upper[2] + 1] |= 1 << i
+
+        self.flat_table = self.table.ravel()
+        # Bitmask values that include each color, to turn a histogram of bitmasks into pixel counts per color
+        values = np.arange(1 << len(self.names))
+        self.members = [np.nonzero(values & (1 << i))[0] for i in range(len(self.names))]
+
+    def classify(self, hsv_image):
+        """Return a bitmask image with the bits of every color matching each pixel."""
+        index = hsv_image[..., 0].astype(np.uint32) << 16
+        index |= hsv_image[..., 1].astype(np.uint32) << 8
+        index |= hsv_image[..., 2]
+        return np.take(self.flat_table, index)
+
+    def mask(self, bits, color_name):
+        """Binary mask of the pixels of one color from a classify() result."""
+        bit = 1 << self.names.index(color_name)
+        return cv2.compare(np.bitwise_and(bits, bits.dtype.type(bit)), 0, cv2.CMP_NE)
+
+    def counts(self, bits):
+        """Number of pixels of each color in a classify() result."""
+        histogram = np.bincount(bits.ravel(), minlength=1 << len(self.names))
+        return np.array([histogram[members].sum() for members in self.members])
+
+
+def detect_shapes_and_colors_lut(image, color_lut, min_area=100):
+    """
+    Single-pass variant of detect_shapes_and_colors.
+
+    Every pixel is classified once through the lookup table, and contours are
+    only extracted for labels that cover enough pixels to form a blob, so the
+    cost no longer grows with the size of the palette.
+    """
+    with profiler.stage("hsv"):
+        hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    with profiler.stage("lut"):
+        bits = color_lut.classify(hsv_image)
+        counts = color_lut.counts(bits)
 
-def detect_aruco_markers(image):
+    detected_shapes = []
+    for index in np.nonzero(counts > min_area)[0]:
+        color_name = color_lut.names[index]
+        with profiler.stage(f"mask:{color_name}"):
+            mask = color_lut.mask(bits, color_name)
+        detected_shapes.extend(extract_shapes(mask, color_name, min_area))
 
-    markerDictionary = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_5X5_50)
+    return detected_shapes
+
+
+
+
+def create_aruco_detector(dictionary=cv2.aruco.DICT_5X5_50):
+    """Build an ArucoDetector for the given predefined dictionary."""
+    markerDictionary = cv2.aruco.getPredefinedDictionary(dictionary)
     detectorParam = cv2.aruco.DetectorParameters()
-    detector = cv2.aruco.ArucoDetector(markerDictionary, detectorParam)
+    return cv2.aruco.ArucoDetector(markerDictionary, detectorParam)
+
+
+def detect_aruco_markers(image, detector=None, pyramid_scale=None):
+
+    if detector is None:
+        detector = create_aruco_detector()
+    if pyramid_scale:
+        return detect_aruco_markers_pyramid(image, detector, pyramid_scale)
     corners, ids, rejected = detector.detectMarkers(image)
 
     list_of_aruco = []
@@ -61,6 +178,111 @@ def detect_aruco_markers(image):
 
     return list_of_aruco
 
+
+def padded_window(points, pad, width, height):
+    """Bounding box [x0, y0, x1, y1] of `points` grown by `pad` pixels and clipped to the image."""
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+    x_min, y_min = points.min(axis=0)
+    x_max, y_max = points.max(axis=0)
+    return [
+        max(int(x_min - pad), 0),
+        max(int(y_min - pad), 0),
+        min(int(x_max + pad) + 1, width),
+        min(int(y_max + pad) + 1, height),
+    ]
+
+
+def merge_windows(windows):
+    """Merge overlapping [x0, y0, x1, y1] windows so nothing is searched twice."""
+    windows = [list(window) for window in windows]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(windows)):
+            for j in range(i + 1, len(windows)):
+                a, b = windows[i], windows[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    windows[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del windows[j]
+                    merged = True
+                    break
+            if merged:
+                break
+
+    return windows
+
+
+def detect_shapes_and_colors_pyramid(image, scale=0.5, color_lut=None, margin=8, min_area=100):
+    """
+    Coarse-to-fine variant of detect_shapes_and_colors with the same output.
+
+    Blobs are found on an image downscaled by `scale`, then each one is
+    re-segmented at full resolution inside a small window around it so the
+    returned points keep full-resolution accuracy.
+    """
+    height, width = image.shape[:2]
+    small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    coarse_shapes = detect_shapes_and_colors(small, color_lut, min_area=min_area * scale * scale)
+
+    detected_shapes = []
+    for (shape, color_name), points in coarse_shapes:
+        coarse_points = np.float32(points) / scale
+        center = coarse_points.mean(axis=0)
+        x0, y0, x1, y1 = padded_window(coarse_points, margin + 1 / scale, width, height)
+
+        with profiler.stage("hsv"):
+            hsv_window = cv2.cvtColor(image[y0:y1, x0:x1], cv2.COLOR_BGR2HSV)
+        refined = extract_shapes(color_mask(hsv_window, color_name, color_lut), color_name, min_area)
+        if refined:
+            # Several blobs may share the window, keep the one closest to the candidate
+            best = min(refined, key=lambda r: np.linalg.norm(np.mean(r[1], axis=0) + (x0, y0) - center))
+            (shape, _), refined_points = best
+            points = [(x + x0, y + y0) for x, y in refined_points]
+        else:
+            points = [tuple(point) for point in coarse_points.astype(np.int32)]
+
+        detected_shapes.append(((shape, color_name), points))
+
+    return detected_shapes
+
+
+def detect_aruco_markers_pyramid(image, detector, scale=0.5, margin=16, max_candidates=32):
+    """
+    Coarse-to-fine variant of detect_aruco_markers with the same output.
+
+    Markers and rejected quad candidates are found on an image downscaled by
+    `scale`, then decoded again at full resolution inside padded windows
+    around them. Candidates too small to decode at the coarse level still
+    get a chance at full resolution.
+    """
+    height, width = image.shape[:2]
+    small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    corners, ids, rejected = detector.detectMarkers(small)
+
+    coarse_markers = []
+    if ids is not None:
+        coarse_markers = [(ids[i][0], corners[i][0] / scale) for i in range(len(ids))]
+    candidates = sorted((c[0] / scale for c in rejected), key=cv2.contourArea, reverse=True)[:max_candidates]
+
+    windows = [
+        padded_window(quad, margin + 0.5 * np.ptp(quad, axis=0).max(), width, height)
+        for quad in [quad for _, quad in coarse_markers] + candidates
+    ]
+
+    list_of_aruco = []
+    for x0, y0, x1, y1 in merge_windows(windows):
+        for aruco_id, marker_corners in detect_aruco_markers(image[y0:y1, x0:x1], detector):
+            list_of_aruco.append((aruco_id, marker_corners + np.float32([x0, y0])))
+
+    # Keep coarse detections that could not be refined at full resolution
+    for aruco_id, quad in coarse_markers:
+        center = quad.mean(axis=0)
+        if not any(found_id == aruco_id and np.linalg.norm(found.mean(axis=0) - center) < margin
+                   for found_id, found in list_of_aruco):
+            list_of_aruco.append((aruco_id, quad.astype(np.float32)))
+
+    return list_of_aruco
+
 from collections import defaultdict
 
 
@@ -160,12 +382,12 @@ def get_6dof_pos(points, is_aruco=False):
         x = (points[0][0] + points[2][0]) / 2
         y = (points[0][1] + points[2][1]) / 2
         yaw = np.arctan2(points[2][1] - points[0][1], points[2][0] - points[0][0])
-        return np.array((x, y, 0, 0, 0, yaw),dtype=np.int32)
+        return np.array((x, y, 0, 0, 0, yaw),dtype=np.float64)
     
     
     else:
         point = np.mean(points,axis=0)
-        return np.array((point[0], point[1], 0, 0, 0, 0),dtype=np.int32)
+        return np.array((point[0], point[1], 0, 0, 0, 0),dtype=np.float64)
     
 
 def order_points(pts):
@@ -213,6 +435,48 @@ def process_entity_data(entity_data, M):
     return entity_data
 
 
+def process_entity_data_batched(entity_data, M):
+    """
+    Same output as process_entity_data, but every entity's points are stacked
+    into one array and transformed with a single call, then split back out.
+    """
+    chunks = []
+    if len(entity_data[EntityType.BOUNDARY]) > 0:
+        chunks.append(np.asarray(entity_data[EntityType.BOUNDARY], dtype=np.float64).reshape(-1, 2))
+    for entity_type in entity_data:
+        if entity_type != EntityType.BOUNDARY:
+            for entity, pos in entity_data[entity_type]:
+                if len(pos) > 0:
+                    chunks.append(np.asarray(pos, dtype=np.float64).reshape(-1, 2))
+
+    if chunks:
+        lengths = [len(chunk) for chunk in chunks]
+        transformed = np.split(transform_points(np.concatenate(chunks), M), np.cumsum(lengths)[:-1])
+    else:
+        transformed = []
+
+    index = 0
+    for entity_type in entity_data:
+        if entity_type == EntityType.BOUNDARY:
+            if len(entity_data[EntityType.BOUNDARY]) > 0:
+                entity_data[EntityType.BOUNDARY] = transformed[index]
+                index += 1
+            else:
+                entity_data[EntityType.BOUNDARY] = np.array([], dtype=np.int32)
+        else:
+            process_entity_pos = []
+            for entity, pos in entity_data[entity_type]:
+                if len(pos) > 0:
+                    tf_pose = transformed[index]
+                    index += 1
+                    if entity_type in [EntityType.OBJECT,EntityType.PLAYER] :
+                        tf_pose = get_6dof_pos(tf_pose,entity.aruco_id!=None)
+                    process_entity_pos.append((entity,tf_pose))
+            entity_data[entity_type] = process_entity_pos
+
+    return entity_data
+
+
 def process_boundary_and_region_data(list_of_entity_pos):
 
     all_points = []
@@ -237,14 +501,18 @@ def process_boundary_and_region_data(list_of_entity_pos):
 
     return hull_points
 
-def map_to_response(data_entity):
+def map_to_response(data_entity, velocities=None, timestamp=None):
+    velocities = velocities or {}
     response = []
     for entity_type in data_entity:
         resp_dict = {}
         if entity_type in [EntityType.OBJECT,EntityType.PLAYER] :
             for entity, pos in data_entity[entity_type]:
+                resp_dict = {}
                 resp_dict['id'] = entity.id
                 resp_dict['pose'] = pos
+                resp_dict['velocity'] = velocities.get(entity, np.zeros(6))
+                resp_dict['timestamp'] = timestamp
                 resp_dict['object_type'] = entity_type
                 resp_dict['tag'] = entity.tag
                 resp_dict['mobility'] = entity.mobility
@@ -252,8 +520,11 @@ def map_to_response(data_entity):
                 response.append(resp_dict)
         elif entity_type in [EntityType.REGION] :
             for entity, pos in data_entity[entity_type]:
+                resp_dict = {}
                 resp_dict['id'] = entity.id
                 resp_dict['pose'] = np.zeros(6)
+                resp_dict['velocity'] = np.zeros(6)
+                resp_dict['timestamp'] = timestamp
                 resp_dict['object_type'] = entity_type
                 resp_dict['tag'] = entity.tag
                 resp_dict['mobility'] = entity.mobility
@@ -263,6 +534,8 @@ def map_to_response(data_entity):
             pos = data_entity[entity_type]
             resp_dict['id'] = 'boundary'
             resp_dict['pose'] = np.zeros(6)
+            resp_dict['velocity'] = np.zeros(6)
+            resp_dict['timestamp'] = timestamp
             resp_dict['object_type'] = entity_type
             resp_dict['tag'] = 'boundary_polygon'
             resp_dict['mobility'] = 'fixed'
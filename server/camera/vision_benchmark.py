@@ -0,0 +1,274 @@
+"""
+Synthetic arena frames and an offline benchmark of the vision pipeline.
+
+SyntheticArena renders what the camera would see of an arena described by an
+entity config: boundary markers at the arena corners, ArUco or colored-shape
+players moving along known trajectories, colored regions, all seen through
+a perspective camera with optional noise and blur. run_benchmark() feeds
+those frames through ComputerVisionManager.process_frame and reports the
+frame rate, the per-stage profile and the pose error against ground truth.
+
+    python -m camera.vision_benchmark --config camera/config/config1.json --frames 2000
+"""
+import math
+import time
+
+import cv2
+import numpy as np
+
+from camera.arena_entity import EntityType, create_entities_from_json
+from camera.color_ranges import COLOR_RANGES
+from camera.utils import get_6dof_pos
+from camera.vision_profiler import profiler
+
+
+def palette_bgr(color_name):
+    """A BGR color in the middle of the first HSV range of a palette color."""
+    lower, upper = COLOR_RANGES[color_name][0]
+    hsv = np.uint8([[(np.int32(lower) + np.int32(upper)) // 2]])
+    return tuple(int(c) for c in cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)[0, 0])
+
+
+def shape_points(shape, center, size, yaw):
+    """Polygon of a shape of the given size, rotated by yaw, in arena coordinates."""
+    if shape == "triangle":
+        angles = [yaw, yaw + 2 * math.pi / 3, yaw + 4 * math.pi / 3]
+        radius = size / math.sqrt(3)
+    elif shape == "circle":
+        angles = [yaw + i * 2 * math.pi / 32 for i in range(32)]
+        radius = size / 2
+    else:
+        angles = [yaw + math.pi / 4 + i * math.pi / 2 for i in range(4)]
+        radius = size / math.sqrt(2)
+    return np.float32([(center[0] + radius * math.cos(a), center[1] + radius * math.sin(a)) for a in angles])
+
+
+class SyntheticArena:
+    """
+    Renders camera frames of the arena in `config_path`.
+
+    Arena coordinates match the vision output: boundary markers sit on the
+    corners of a `width` x `height` arena. `perspective` is how much narrower
+    the far edge of the arena looks than the near one (0 for a top-down view).
+    """
+    def __init__(self, config_path, width=1000, height=1000, frame_size=(1280, 720), marker_size=80, shape_size=70,
+                 perspective=0.2, noise=0.0, blur=0, fps=30.0, dictionary=cv2.aruco.DICT_5X5_50, seed=0):
+        self.width = width
+        self.height = height
+        self.frame_size = frame_size
+        self.marker_size = marker_size
+        self.shape_size = shape_size
+        self.noise = noise
+        self.blur = blur
+        self.fps = fps
+        self.rng = np.random.default_rng(seed)
+        self.dictionary = cv2.aruco.getPredefinedDictionary(dictionary)
+        self.entities = create_entities_from_json(config_path)
+
+        # Arena drawn top-down on a canvas with a margin for the boundary markers,
+        # then projected into the camera frame
+        self.margin = marker_size
+        self.canvas_size = (width + 2 * self.margin, height + 2 * self.margin)
+        cw, ch = self.canvas_size
+        fw, fh = frame_size
+        inset = perspective * 0.8 * fw / 2
+        canvas_quad = np.float32([[0, 0], [cw, 0], [cw, ch], [0, ch]])
+        frame_quad = np.float32([[0.1 * fw + inset, 0.05 * fh], [0.9 * fw - inset, 0.05 * fh],
+                                 [0.9 * fw, 0.95 * fh], [0.1 * fw, 0.95 * fh]])
+        self.camera = cv2.getPerspectiveTransform(canvas_quad, frame_quad)
+
+        self.markers = {}
+        self.background = self.render_static()
+
+    def marker_patch(self, aruco_id):
+        """Marker image with a white quiet zone of one module around it."""
+        patch = self.markers.get(aruco_id)
+        if patch is None:
+            inner = cv2.aruco.generateImageMarker(self.dictionary, aruco_id, 70)
+            patch = cv2.copyMakeBorder(inner, 10, 10, 10, 10, cv2.BORDER_CONSTANT, value=255)
+            patch = self.markers[aruco_id] = cv2.cvtColor(patch, cv2.COLOR_GRAY2BGR)
+        return patch
+
+    def to_canvas(self, points):
+        return np.float32(points) + self.margin
+
+    def draw_marker(self, canvas, aruco_id, center, yaw):
+        """Draws a marker and returns its corners in arena coordinates, in detection order."""
+        patch = self.marker_patch(aruco_id)
+        quiet = self.marker_size * 90 / 70
+        outer = shape_points("rectangle", center, quiet, yaw)
+        inner = shape_points("rectangle", center, self.marker_size, yaw)
+        # shape_points starts at the corner +45 degrees from yaw, the marker's top-left is opposite
+        outer, inner = np.roll(outer, 2, axis=0), np.roll(inner, 2, axis=0)
+
+        dst = self.to_canvas(outer)
+        x0, y0 = np.floor(dst.min(axis=0)).astype(int)
+        x1, y1 = np.ceil(dst.max(axis=0)).astype(int)
+        size = patch.shape[0]
+        src = np.float32([[0, 0], [size, 0], [size, size], [0, size]])
+        transform = cv2.getPerspectiveTransform(src, np.float32(dst - (x0, y0)))
+        warped = cv2.warpPerspective(patch, transform, (x1 - x0, y1 - y0))
+        mask = cv2.warpPerspective(np.full(patch.shape[:2], 255, np.uint8), transform, (x1 - x0, y1 - y0))
+        roi = canvas[y0:y1, x0:x1]
+        roi[mask > 0] = warped[mask > 0]
+        return inner
+
+    def draw_shape(self, canvas, entity, center, yaw):
+        points = shape_points(entity.shape, center, self.shape_size, yaw)
+        cv2.fillPoly(canvas, [np.round(self.to_canvas(points)).astype(np.int32)], palette_bgr(entity.color),
+                     cv2.LINE_AA)
+
+    def corners(self):
+        return [(0, 0), (self.width, 0), (self.width, self.height), (0, self.height)]
+
+    def render_static(self):
+        """Floor, boundary markers and regions, which do not move."""
+        canvas = np.full((self.canvas_size[1], self.canvas_size[0], 3), 110, np.uint8)
+        boundary = [entity for entity in self.entities if entity.entity_type == EntityType.BOUNDARY]
+        for entity, corner in zip(boundary, self.corners()):
+            if entity.aruco_id is not None:
+                self.draw_marker(canvas, entity.aruco_id, corner, 0.0)
+            else:
+                self.draw_shape(canvas, entity, corner, 0.0)
+
+        regions = [entity for entity in self.entities if entity.entity_type == EntityType.REGION]
+        for i, entity in enumerate(regions):
+            # Along the left and right edges, like goals
+            x = self.width * (0.08 if i % 2 == 0 else 0.92)
+            y = self.height * (0.5 + 0.3 * (i // 2))
+            self.draw_shape(canvas, entity, (x, y), 0.0)
+        return canvas
+
+    def poses(self, frame_index):
+        """Ground-truth (x, y, yaw) of every moving entity, each on its own circular path."""
+        moving = [entity for entity in self.entities if entity.entity_type in (EntityType.PLAYER, EntityType.OBJECT)]
+        t = frame_index / self.fps
+        poses = {}
+        for i, entity in enumerate(moving):
+            phase = 2 * math.pi * i / max(1, len(moving))
+            omega = 0.4 + 0.1 * i
+            angle = phase + omega * t
+            radius = 0.3 * min(self.width, self.height)
+            x = self.width / 2 + radius * math.cos(angle)
+            y = self.height / 2 + radius * math.sin(angle)
+            poses[entity] = (x, y, angle + math.pi / 2)
+        return poses
+
+    def render(self, frame_index):
+        """Returns the camera frame and {entity tag: 6-DoF pose} as the pipeline should report it."""
+        canvas = self.background.copy()
+        truth = {}
+        for entity, (x, y, yaw) in self.poses(frame_index).items():
+            if entity.aruco_id is not None:
+                corners = self.draw_marker(canvas, entity.aruco_id, (x, y), yaw)
+                truth[entity.tag] = get_6dof_pos(corners, is_aruco=True)
+            else:
+                self.draw_shape(canvas, entity, (x, y), yaw)
+                truth[entity.tag] = np.array((x, y, 0, 0, 0, 0), dtype=np.float64)
+
+        frame = cv2.warpPerspective(canvas, self.camera, self.frame_size, borderValue=(60, 60, 60))
+        if self.blur:
+            frame = cv2.GaussianBlur(frame, (self.blur * 2 + 1, self.blur * 2 + 1), 0)
+        if self.noise:
+            noise = self.rng.normal(0, self.noise, frame.shape)
+            frame = np.clip(frame + noise, 0, 255).astype(np.uint8)
+        return frame, truth
+
+
+def angle_error(a, b):
+    return abs((a - b + math.pi) % (2 * math.pi) - math.pi)
+
+
+def run_benchmark(config_path, frames=1000, warmup=30, arena_options=None, **vision_options):
+    """
+    Run the pipeline over synthetic frames. Frames before `warmup` (boundary
+    calibration, filter start-up) are processed but not scored.
+    """
+    from camera.computer_vision import ComputerVisionManager
+
+    arena = SyntheticArena(config_path, **(arena_options or {}))
+    vision_options.setdefault("headless", True)
+    vision_options.setdefault("profile_interval", 0)
+    vision = ComputerVisionManager(None, config_path, width=arena.width, height=arena.height, **vision_options)
+    profiler.reset()
+
+    position_errors = []
+    yaw_errors = []
+    expected = found = 0
+    processing = 0.0
+    try:
+        for index in range(warmup + frames):
+            frame, truth = arena.render(index)
+            timestamp = index / arena.fps
+
+            start = time.perf_counter()
+            profiler.begin_frame()
+            vision.process_frame(frame, timestamp)
+            profiler.end_frame()
+            if index < warmup:
+                continue
+            processing += time.perf_counter() - start
+
+            reported = {entry["tag"]: entry["pose"] for entry in vision.response_model
+                        if entry["object_type"] in (EntityType.PLAYER, EntityType.OBJECT)}
+            is_aruco = {entity.tag: entity.aruco_id is not None for entity in arena.entities}
+            for tag, pose in truth.items():
+                expected += 1
+                if tag not in reported:
+                    continue
+                found += 1
+                position_errors.append(float(np.hypot(*(np.asarray(reported[tag][:2]) - pose[:2]))))
+                if is_aruco[tag]:
+                    yaw_errors.append(math.degrees(angle_error(reported[tag][5], pose[5])))
+    finally:
+        if vision.workers:
+            vision.workers.stop()
+
+    def distribution(values):
+        if not values:
+            return None
+        return {"mean": float(np.mean(values)), "p95": float(np.percentile(values, 95)), "max": float(np.max(values))}
+
+    return {
+        "frames": frames,
+        "fps": frames / processing if processing else 0.0,
+        "detection_rate": found / expected if expected else 0.0,
+        "position_error": distribution(position_errors),  # Arena units
+        "yaw_error": distribution(yaw_errors),  # Degrees, ArUco entities only
+        "stages": profiler.get_stats(),
+    }
+
+
+def print_report(result):
+    print(f"{result['frames']} frames at {result['fps']:.1f} FPS, detection rate {result['detection_rate']:.1%}")
+    for name, unit in (("position_error", ""), ("yaw_error", " deg")):
+        stats = result[name]
+        if stats:
+            print(f"{name}: mean {stats['mean']:.2f}{unit}, p95 {stats['p95']:.2f}{unit}, max {stats['max']:.2f}{unit}")
+    for name, stage in sorted(result["stages"].items(), key=lambda item: -item[1]["mean"]):
+        print(f"  {name:<16} mean {stage['mean'] * 1000:7.2f} ms  p95 {stage['p95'] * 1000:7.2f} ms")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the vision pipeline on synthetic arena frames")
+    parser.add_argument("--config", default="camera/config/config2.json")
+    parser.add_argument("--frames", type=int, default=1000)
+    parser.add_argument("--noise", type=float, default=0.0, help="Gaussian noise sigma in gray levels")
+    parser.add_argument("--blur", type=int, default=0, help="Gaussian blur radius in pixels")
+    parser.add_argument("--perspective", type=float, default=0.2)
+    parser.add_argument("--lut", action="store_true", help="Use the color lookup table")
+    parser.add_argument("--pyramid", type=float, help="Coarse-to-fine detection scale")
+    parser.add_argument("--workers", action="store_true", help="Detect in worker processes")
+    parser.add_argument("--no-tracking", action="store_true", help="Disable entity and marker tracking")
+    parser.add_argument("--no-filter", action="store_true", help="Disable pose filtering")
+    args = parser.parse_args()
+
+    result = run_benchmark(
+        args.config, args.frames,
+        arena_options={"noise": args.noise, "blur": args.blur, "perspective": args.perspective},
+        use_color_lut=args.lut, pyramid_scale=args.pyramid, use_workers=args.workers,
+        track_entities=not args.no_tracking, track_markers=not args.no_tracking, filter_poses=not args.no_filter,
+    )
+    print_report(result)
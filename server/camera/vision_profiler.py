@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class VisionProfiler:
+    """
+    Per-stage timing of the vision pipeline over a sliding window of frames.
+
+    Code wraps its work in `with profiler.stage(name)`; all time spent in a
+    stage during one frame is summed, and end_frame() adds those per-frame
+    totals to the window. Stages not run in a frame (a skipped ArUco scan,
+    a color that was not masked) are simply missing for that frame. When
+    detection runs in worker processes, only the main-process stages and
+    the time waiting for the workers ("workers") are seen.
+    """
+    def __init__(self, window=300, report_interval=5.0):
+        self.enabled = True
+        self.window = window
+        self.report_interval = report_interval
+        self.lock = threading.Lock()
+        self.current = {}
+        self.samples = {}  # stage -> deque of per-frame seconds
+        self.frame_times = deque(maxlen=window)  # end_frame() wall times, for FPS
+        self.frames = 0
+        self.frame_start = None
+        self.next_report = None
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.current[name] = self.current.get(name, 0.0) + seconds
+
+    def begin_frame(self):
+        self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        """Commit the stage times of the frame, and print a summary every report_interval seconds."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        with self.lock:
+            current, self.current = self.current, {}
+            if self.frame_start is not None:
+                current["total"] = now - self.frame_start
+            for name, seconds in current.items():
+                samples = self.samples.get(name)
+                if samples is None:
+                    samples = self.samples[name] = deque(maxlen=self.window)
+                samples.append(seconds)
+            self.frame_times.append(now)
+            self.frames += 1
+        self.frame_start = None
+
+        if self.next_report is None:
+            self.next_report = now + self.report_interval
+        elif self.report_interval and now >= self.next_report:
+            self.next_report = now + self.report_interval
+            print(self.summary())
+
+    def fps(self):
+        with self.lock:
+            if len(self.frame_times) < 2:
+                return 0.0
+            return (len(self.frame_times) - 1) / (self.frame_times[-1] - self.frame_times[0])
+
+    def get_stats(self):
+        """Per stage, over the window: frames it ran in and mean/p50/p95/p99/max seconds."""
+        with self.lock:
+            samples = {name: np.array(values) for name, values in self.samples.items() if values}
+        stats = {}
+        for name, values in samples.items():
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            stats[name] = {
+                "count": len(values),
+                "mean": float(values.mean()),
+                "p50": float(p50),
+                "p95": float(p95),
+                "p99": float(p99),
+                "max": float(values.max()),
+            }
+        return stats
+
+    def summary(self):
+        """One line: FPS, then mean and p95 milliseconds per stage, slowest first."""
+        stats = self.get_stats()
+        total = stats.pop("total", None)
+        parts = [f"{self.fps():.1f} FPS"]
+        if total:
+            parts.append(f"frame {total['mean'] * 1000:.1f}/{total['p95'] * 1000:.1f} ms")
+        for name, stage in sorted(stats.items(), key=lambda item: -item[1]["mean"]):
+            parts.append(f"{name} {stage['mean'] * 1000:.2f}/{stage['p95'] * 1000:.2f}")
+        return " | ".join(parts)
+
+    def reset(self):
+        with self.lock:
+            self.current = {}
+            self.samples = {}
+            self.frame_times.clear()
+            self.frames = 0
+
+
+# Shared by the vision modules, so helper functions can be timed without passing it around
+profiler = VisionProfiler()
@@ -0,0 +1,206 @@
+import multiprocessing as mp
+import queue
+import numpy as np
+from multiprocessing import shared_memory
+
+COLOR_WORKER = "color"
+MARKER_WORKER = "marker"
+
+
+class SharedFrameRing:
+    """
+    Ring of frame slots in a multiprocessing.shared_memory block.
+
+    Frame `seq` lives in slot `seq % slots`, so a frame is written once by the
+    producer and read in place by every worker.
+    """
+    def __init__(self, shape, dtype=np.uint8, slots=4, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=frame_bytes * slots)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def write(self, seq, frame):
+        self.frames[seq % self.slots] = frame
+
+    def read(self, seq):
+        return self.frames[seq % self.slots]
+
+    def close(self):
+        del self.frames
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def worker_main(kind, ring_name, shape, slots, use_color_lut, track_markers, pyramid_scale, task_queue, result_queue,
+                latest_seq):
+    """
+    Entry point of a detection worker process.
+
+    Tasks older than `latest_seq`, the newest frame submitted, are skipped:
+    the pool no longer waits for them and their ring slot may be rewritten
+    at any time. A result is also dropped when the slot was handed to a
+    newer frame while it was being read, so torn frames are never reported.
+    """
+    # Imported here so the parent does not need OpenCV state for the children
+    from camera.utils import detect_shapes_and_colors, ColorLUT
+    from camera.marker_detector import MarkerDetector
+
+    ring = SharedFrameRing(shape, slots=slots, name=ring_name)
+    if kind == COLOR_WORKER:
+        color_lut = ColorLUT() if use_color_lut else None
+        detect = lambda image, task: detect_shapes_and_colors(image, color_lut, pyramid_scale, regions=task.get("regions"))
+    else:
+        marker_detector = MarkerDetector(roi_tracking=track_markers, pyramid_scale=pyramid_scale)
+
+        def detect(image, task):
+            marker_detector.ignore_ids = task.get("ignore_ids", set())
+            return marker_detector.detect(image, task.get("full_scan", False))
+
+    # Sequence number 0 tells the pool this worker is ready
+    result_queue.put((kind, 0, None))
+
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            seq, options = task
+            if seq < latest_seq.value:
+                continue
+            try:
+                result = detect(ring.read(seq), options)
+            except Exception as e:
+                print(f"{kind} worker error: {e}")
+                result = []
+            if latest_seq.value >= seq + slots:
+                continue
+            result_queue.put((kind, seq, result))
+    finally:
+        ring.close()
+
+
+class VisionWorkerPool:
+    """
+    Runs color and marker detection in two worker processes.
+
+    Each frame is copied once into a SharedFrameRing, both workers are told
+    its sequence number, and their results are merged back by that number.
+    The ring is created lazily from the shape of the first frame.
+    """
+    def __init__(self, use_color_lut=False, track_markers=True, pyramid_scale=None, slots=4, timeout=1.0, startup_timeout=30.0):
+        self.use_color_lut = use_color_lut
+        self.track_markers = track_markers
+        self.pyramid_scale = pyramid_scale
+        self.slots = slots
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+
+        self.ring = None
+        self.processes = []
+        self.task_queues = {}
+        self.result_queue = None
+        self.latest_seq = None  # Shared with the workers, set before a slot is rewritten
+        self.seq = 0
+        self.pending = {}  # seq -> {worker kind: result}
+        self.stale_results = 0
+
+    def start(self, shape):
+        ctx = mp.get_context("spawn")
+        self.ring = SharedFrameRing(shape, slots=self.slots)
+        self.result_queue = ctx.Queue()
+        self.latest_seq = ctx.Value("q", self.seq, lock=False)
+        for kind in (COLOR_WORKER, MARKER_WORKER):
+            self.task_queues[kind] = ctx.Queue()
+            process = ctx.Process(
+                target=worker_main,
+                args=(kind, self.ring.name, self.ring.shape, self.slots, self.use_color_lut,
+                      self.track_markers, self.pyramid_scale, self.task_queues[kind], self.result_queue,
+                      self.latest_seq),
+                daemon=True,
+            )
+            process.start()
+            self.processes.append(process)
+
+        # Spawning and importing OpenCV takes a while, wait for both workers
+        for _ in self.processes:
+            try:
+                self.result_queue.get(timeout=self.startup_timeout)
+            except queue.Empty:
+                self.stop()
+                raise RuntimeError("Vision workers failed to start")
+
+    def stop(self):
+        for task_queue in self.task_queues.values():
+            task_queue.put(None)
+        for process in self.processes:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        self.task_queues = {}
+        if self.ring:
+            self.ring.close()
+            self.ring = None
+
+    def detect(self, image, ignore_ids=frozenset(), detect_markers=True, regions=None, full_scan=False):
+        """
+        Detect features in `image` using both workers, returns (shape_color_points, aruco_marker_points).
+        Markers with ids in `ignore_ids` are left out of the marker results, and the
+        marker worker is not used at all when `detect_markers` is False. Color
+        detection is limited to `regions` when given, and `full_scan` makes the marker
+        worker search the whole frame instead of around the markers it tracks.
+        """
+        if self.ring is None:
+            self.start(image.shape)
+        elif image.shape != self.ring.shape:
+            # Resolution changed, rebuild the ring for the new frame size
+            self.stop()
+            self.start(image.shape)
+
+        self.seq += 1
+        seq = self.seq
+        # Published before the write, so a worker still reading this slot sees it was reused
+        self.latest_seq.value = seq
+        self.ring.write(seq, image)
+
+        kinds = [COLOR_WORKER, MARKER_WORKER] if detect_markers else [COLOR_WORKER]
+        self.task_queues[COLOR_WORKER].put((seq, {"regions": regions}))
+        if detect_markers:
+            self.task_queues[MARKER_WORKER].put((seq, {"ignore_ids": ignore_ids, "full_scan": full_scan}))
+
+        return self.collect(seq, kinds)
+
+    def collect(self, seq, kinds):
+        """Wait until the given workers reported on `seq`, discarding results of older frames."""
+        while True:
+            results = self.pending.get(seq, {})
+            if len(results) == len(kinds):
+                del self.pending[seq]
+                return results.get(COLOR_WORKER, []), results.get(MARKER_WORKER, [])
+
+            try:
+                kind, result_seq, result = self.result_queue.get(timeout=self.timeout)
+            except queue.Empty:
+                if not all(process.is_alive() for process in self.processes):
+                    raise RuntimeError("Vision worker process died")
+                print(f"Vision workers timed out on frame {seq}")
+                self.pending.pop(seq, None)
+                return results.get(COLOR_WORKER, []), results.get(MARKER_WORKER, [])
+
+            if result_seq < seq:
+                self.stale_results += 1
+                continue
+            self.pending.setdefault(result_seq, {})[kind] = result
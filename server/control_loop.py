@@ -0,0 +1,70 @@
+import time
+from collections import deque
+
+
+class ControlLoop:
+    """
+    Calls `tick` at a fixed rate until `is_running` returns False.
+
+    Ticks are scheduled against absolute deadlines so sleep errors do not
+    accumulate. Jitter is how late a tick started after its deadline. A tick
+    that is still running when the next deadline passes is an overrun; the
+    ticks it missed are skipped rather than fired in a burst.
+    """
+    def __init__(self, rate, tick, is_running, report_interval=10.0, window=500):
+        self.period = 1.0 / rate
+        self.tick = tick
+        self.is_running = is_running
+        self.report_interval = report_interval
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.jitter = deque(maxlen=window)
+        self.durations = deque(maxlen=window)
+
+    def run(self):
+        next_tick = time.perf_counter()
+        next_report = next_tick + self.report_interval
+        while self.is_running():
+            now = time.perf_counter()
+            if now < next_tick:
+                time.sleep(next_tick - now)
+                now = time.perf_counter()
+
+            self.jitter.append(now - next_tick)
+            self.tick()
+            end = time.perf_counter()
+            self.durations.append(end - now)
+            self.ticks += 1
+
+            next_tick += self.period
+            if end > next_tick:
+                self.overruns += 1
+                missed = int((end - next_tick) / self.period) + 1
+                self.skipped += missed - 1
+                next_tick += (missed - 1) * self.period
+
+            if self.report_interval and end >= next_report:
+                self.report()
+                next_report = end + self.report_interval
+
+    def get_stats(self):
+        jitter = list(self.jitter)
+        durations = list(self.durations)
+        return {
+            "rate": 1.0 / self.period,
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "jitter_mean": sum(jitter) / len(jitter) if jitter else 0.0,
+            "jitter_max": max(jitter, default=0.0),
+            "tick_time_mean": sum(durations) / len(durations) if durations else 0.0,
+            "tick_time_max": max(durations, default=0.0),
+        }
+
+    def report(self):
+        stats = self.get_stats()
+        print(f"Control loop at {stats['rate']:.0f} Hz: {stats['ticks']} ticks, "
+              f"{stats['overruns']} overruns ({stats['skipped']} skipped), "
+              f"jitter mean {stats['jitter_mean'] * 1000:.2f} ms max {stats['jitter_max'] * 1000:.2f} ms, "
+              f"tick time max {stats['tick_time_max'] * 1000:.2f} ms")
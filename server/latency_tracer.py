@@ -0,0 +1,110 @@
+import bisect
+import math
+import threading
+import time
+from collections import OrderedDict
+
+# Hops in the order a frame's data passes them, from capture to the radio
+HOPS = ("vision", "publish", "state_sent", "reply", "validated", "serial_write")
+
+
+class LatencyHistogram:
+    """Log-spaced latency histogram from 10 us to 10 s, cheap to update and to read percentiles from."""
+    def __init__(self, low=1e-5, high=10.0, buckets_per_decade=20):
+        decades = math.log10(high / low)
+        self.bounds = [low * 10 ** (i / buckets_per_decade) for i in range(int(decades * buckets_per_decade) + 1)]
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile."""
+        if not self.count:
+            return 0.0
+        target = q / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return self.max
+
+    def get_stats(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class LatencyTracer:
+    """
+    Follows frames from camera capture to the serial write.
+
+    A frame's trace id is its capture timestamp, which already rides along
+    in the response model, the world snapshot, the player state ("timestamp")
+    and, echoed back, the player's command ("trace"). Each mark() records
+    the time since the previous hop of the same trace and the time since
+    capture. A hop can be passed several times per frame (one state per
+    player), every pass is recorded.
+    """
+    def __init__(self, max_traces=512):
+        self.enabled = True
+        self.max_traces = max_traces
+        self.lock = threading.Lock()
+        self.traces = OrderedDict()  # trace id -> {hop: time}
+        self.hop_latency = {hop: LatencyHistogram() for hop in HOPS}
+        self.total_latency = {hop: LatencyHistogram() for hop in HOPS}
+
+    def mark(self, trace, hop, now=None):
+        if not self.enabled or trace is None:
+            return
+        now = time.time() if now is None else now
+        with self.lock:
+            marks = self.traces.get(trace)
+            if marks is None:
+                marks = self.traces[trace] = {}
+                while len(self.traces) > self.max_traces:
+                    self.traces.popitem(last=False)
+
+            # Time since the latest earlier hop this trace passed
+            previous = trace
+            for earlier in HOPS[:HOPS.index(hop)]:
+                previous = marks.get(earlier, previous)
+            marks[hop] = now
+            self.hop_latency[hop].add(max(0.0, now - previous))
+            self.total_latency[hop].add(max(0.0, now - trace))
+
+    def reset(self):
+        with self.lock:
+            self.traces.clear()
+            self.hop_latency = {hop: LatencyHistogram() for hop in HOPS}
+            self.total_latency = {hop: LatencyHistogram() for hop in HOPS}
+
+    def get_stats(self):
+        """Per hop: "hop" is the time since the previous hop, "total" the time since capture."""
+        with self.lock:
+            return {hop: {"hop": self.hop_latency[hop].get_stats(), "total": self.total_latency[hop].get_stats()}
+                    for hop in HOPS}
+
+    def dump(self):
+        lines = [f"{'hop':<14}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'since capture p50/p99 ms':>28}"]
+        for hop, stats in self.get_stats().items():
+            step, total = stats["hop"], stats["total"]
+            lines.append(f"{hop:<14}{step['count']:>8}{step['p50'] * 1000:>10.2f}{step['p95'] * 1000:>10.2f}"
+                         f"{step['p99'] * 1000:>10.2f}{total['p50'] * 1000:>17.2f} / {total['p99'] * 1000:.2f}")
+        print("\n".join(lines))
+
+
+# Shared by the manager, socket and serial layers
+tracer = LatencyTracer()
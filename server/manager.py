@@ -1,11 +1,18 @@
 from enum import Enum
+import signal
 import threading
 import time
 import os
 
 from socket_server import SocketInterface
-from serial_interface import SerialInterface
+from async_socket_server import AsyncSocketInterface
+from serial_interface import SerialInterface, serial_port
+from control_loop import ControlLoop
+from latency_tracer import tracer
+from state_recorder import StateRecorder
+from simulator import ArenaSimulator
 from camera.computer_vision import ComputerVisionManager
+from camera.arena_entity import create_entities_from_json, EntityType as VisionEntityType
 
 player_ids = ["player1", "player2", "player3", "player4"]
 
@@ -72,10 +79,60 @@ default_response = [
 ]
 
 
+# Vision entity types (camera.arena_entity.EntityType values) to manager entity types
+VISION_ENTITY_TYPES = {
+    "boundary": EntityType.BOUNDARY,
+    "player": EntityType.PLAYER,
+    "object": EntityType.OBSTACLE,
+    "region": EntityType.REGION,
+}
+
+
+def default_vision_tags(config_path, player_ids):
+    """Vision tags to manager ids: the config's players in order to `player_ids`, its first object to the ball."""
+    entities = create_entities_from_json(config_path)
+    vision_players = [entity.tag for entity in entities if entity.entity_type == VisionEntityType.PLAYER]
+    vision_objects = [entity.tag for entity in entities if entity.entity_type == VisionEntityType.OBJECT]
+    vision_tags = dict(zip(vision_players, player_ids))
+    if vision_objects:
+        vision_tags[vision_objects[0]] = "ball"
+    return vision_tags
+
+
+def from_vision_response(response, vision_tags=None):
+    """
+    Translate ComputerVisionManager's response model into the entity format above.
+    Entity ids are looked up in `vision_tags`, tags missing from it are used as they are.
+    """
+    vision_tags = vision_tags or {}
+    entities = []
+    for obj in response:
+        entity_type = VISION_ENTITY_TYPES[obj["object_type"].value]
+        entity = {
+            "id": "boundary" if entity_type == EntityType.BOUNDARY else vision_tags.get(obj["tag"], obj["tag"]),
+            "pos": tuple(float(v) for v in obj["pose"]),
+            "velocity": tuple(float(v) for v in obj.get("velocity", (0, 0, 0, 0, 0, 0))),
+            "timestamp": obj.get("timestamp"),
+            "type": entity_type,
+            "tag": [obj["tag"]],
+            "mobility": Mobility.STATIC if obj["mobility"] in (None, "fixed") else Mobility.DYNAMIC,
+            "other": {},
+        }
+        if entity_type in (EntityType.BOUNDARY, EntityType.REGION):
+            points = [tuple(float(v) for v in point) for point in obj["options"]["boundary_points"]]
+            key = "boundary_points" if entity_type == EntityType.BOUNDARY else "polygon"
+            entity["other"][key] = points
+        entities.append(entity)
+
+    return entities
+
+
 class Player:
     def __init__(self, id: str):
         self.id = id
         self.pos = (0, 0, 0, 0, 0, 0)
+        self.velocity = (0, 0, 0, 0, 0, 0)
+        self.timestamp = None  # Capture time of the frame the pose was measured in
         self.boost_available = False
         self.team: Team = None
 
@@ -83,6 +140,8 @@ class Player:
         return {
             "id": self.id,
             "pos": self.pos,
+            "velocity": self.velocity,
+            "timestamp": self.timestamp,
             "boost_available": self.boost_available
         }
 
@@ -97,26 +156,60 @@ class Team:
 
 
 class Manager:
-    def __init__(self):
+    def __init__(self, async_sockets=False, multicast_group=None, binary_serial=False, control_rate=20,
+                 serial_port=serial_port, record_path=None, player_ids=player_ids, simulate=False, sim_rate=200,
+                 vision_tags=None, camera_config=None, vision_options=None):
         self.running = True
-        self.player_datas = {pid: Player(pid) for pid in player_ids}
+        self.player_ids = list(player_ids)
+        self.player_datas = {pid: Player(pid) for pid in self.player_ids}
+        # First half of the players is red, the rest blue
+        half = (len(self.player_ids) + 1) // 2
         self.teams = [
-            Team("red", "blue_goal", [self.player_datas["player1"], self.player_datas["player2"]]),
-            Team("blue", "red_goal", [self.player_datas["player3"], self.player_datas["player4"]])
+            Team("red", "blue_goal", [self.player_datas[pid] for pid in self.player_ids[:half]]),
+            Team("blue", "red_goal", [self.player_datas[pid] for pid in self.player_ids[half:]])
         ]
 
-        camera_config = os.path.join(os.path.dirname(__file__), "camera/config/config2.json")
-
-        self.socket_interface = SocketInterface(self)
-        self.serial_interface = SerialInterface(self)
-        self.camera_interface = ComputerVisionManager(self, camera_config)
+        if camera_config is None:
+            camera_config = os.path.join(os.path.dirname(__file__), "camera/config/config2.json")
+
+        # Camera config tags ("playerA", ...) to player ids and "ball", see default_vision_tags
+        self.vision_tags = default_vision_tags(camera_config, self.player_ids) if vision_tags is None else vision_tags
+        self.unmapped_tags = set()
+
+        # One asyncio loop for every player connection instead of a thread per client
+        # State also goes out over UDP to clients that ask for it, and to `multicast_group` if set
+        if async_sockets:
+            self.socket_interface = AsyncSocketInterface(self, multicast_group=multicast_group)
+        else:
+            self.socket_interface = SocketInterface(self, multicast_group=multicast_group)
+        if simulate:
+            # Physics simulation instead of the camera and robots, poses are published at `sim_rate` Hz
+            goal_tags = {player.id: player.team.goal_tag for player in self.player_datas.values()}
+            self.camera_interface = ArenaSimulator(self, self.player_ids, goal_tags, rate=sim_rate)
+            self.serial_interface = self.camera_interface.serial
+        else:
+            # Binary serial packets need the matching bridge firmware, JSON lines work with any
+            self.serial_interface = SerialInterface(self, port=serial_port, binary=binary_serial,
+                                                    robot_ids=self.player_ids)
+            # Keyword arguments of ComputerVisionManager: headless, preview_port, frame_source, use_workers, ...
+            self.camera_interface = ComputerVisionManager(self, camera_config, **(vision_options or {}))
+
+        # Commands are sent in one batch per control tick, None forwards each one as it arrives
+        self.command_lock = threading.Lock()
+        self.pending_commands = {}
+        self.control_loop = None
+        if control_rate:
+            self.control_loop = ControlLoop(control_rate, self.control_tick, lambda: self.running)
+
+        # Every world snapshot is appended to this log, replay it with state_recorder.py
+        self.recorder = StateRecorder(record_path) if record_path else None
 
     def validate_response(self, response: dict):
         player_id = response.get("player_id")
         velocity = response.get("velocity", (0, 0))
         boost = response.get("actions", {}).get("boost", False)
 
-        if not player_id or player_id not in player_ids:
+        if not player_id or player_id not in self.player_datas:
             print(f"Invalid player ID: {player_id}")
             return None
         
@@ -130,25 +223,53 @@ class Manager:
         w = max(min(-w * 10, MAX_VELOCITY), MIN_VELOCITY)
 
         v = v * 1.5 if boost else v
-        return {"player_id": player_id, "v": int(v), "w": int(w)}
+        serial_data = {"player_id": player_id, "v": int(v), "w": int(w)}
+
+        # Capture timestamp of the frame the player reacted to, see LatencyTracer
+        trace = response.get("trace")
+        if trace is not None:
+            serial_data["trace"] = trace
+            tracer.mark(trace, "validated")
+        return serial_data
 
     def process_player_data(self, data):
         # player_id = data.get("player_id")
         # print(f"Player {player_id} sent data: {data}")
         if "error" in data:
             return print(f"Error received from player: {data['error']}")
+        tracer.mark(data.get("trace"), "reply")
+
+        if self.control_loop:
+            # Only the newest command per player is kept until the next tick
+            with self.command_lock:
+                self.pending_commands[data.get("player_id")] = data
+            return
 
         serial_data = self.validate_response(data)
         if serial_data:
             self.serial_interface.send_data(serial_data)
 
+    def control_tick(self):
+        with self.command_lock:
+            commands, self.pending_commands = self.pending_commands, {}
+
+        batch = [serial_data for serial_data in map(self.validate_response, commands.values()) if serial_data]
+        self.serial_interface.send_batch(batch)
+
+    def get_control_stats(self):
+        return self.control_loop.get_stats() if self.control_loop else {}
+
+    def get_latency_stats(self):
+        """Per-hop latency percentiles from camera capture to the serial write, see LatencyTracer."""
+        return tracer.get_stats()
+
     def process_serial_data(self, data):
         print(f"Serial dude sent: {data}")
         player_id = data.get("id")
         ldr_value = data.get('ldr', 0)
 
         player = self.player_datas.get(player_id)
-        if ldr_value > 500:
+        if player and ldr_value > 500:
             player.boost_available = True
 
     # def opencv_detection(self):
@@ -159,33 +280,53 @@ class Manager:
     #         # self.game_loop(response)
 
     def process_frame(self, response, image):
+        response = from_vision_response(response, self.vision_tags)
         ball_pos = (0, 0, 0, 0, 0, 0)
+        ball_velocity = (0, 0, 0, 0, 0, 0)
+        timestamp = None
         goal_pos = {
             "red_goal": [(0, 0), (0, 0)],
             "blue_goal": [(0, 0), (0, 0)]
         }
 
         for obj in response:
+            timestamp = obj["timestamp"]
             if obj["type"] == EntityType.PLAYER:
                 player = self.player_datas.get(obj["id"])
-                player.pos = obj["pos"]
+                if player:
+                    player.pos = obj["pos"]
+                    player.velocity = obj["velocity"]
+                    player.timestamp = obj["timestamp"]
+                elif obj["id"] not in self.unmapped_tags:
+                    self.unmapped_tags.add(obj["id"])
+                    print(f"Warning: vision player {obj['id']} is not mapped to a player id, add it to vision_tags")
 
             elif obj["id"] == "ball":
                 ball_pos = obj["pos"]
+                ball_velocity = obj["velocity"]
 
             elif obj["type"] == EntityType.REGION and 'goal' in obj["id"]:
                 goal_pos[obj["id"]] = obj["other"]["polygon"]
 
-        # Send data to clients
-        for player in self.player_datas.values():
-            team_goal_pos = goal_pos[player.team.goal_tag]
-            self.socket_interface.send_to_client(player.id, {
-                "player": player.get_json(),
-                "target_pos": ball_pos,
-                "goal_pos": team_goal_pos
-            })
+        # Send one snapshot, the socket layer splits it into per-player views
+        world = {
+            "timestamp": timestamp,
+            "ball": {"pos": ball_pos, "velocity": ball_velocity},
+            "goals": goal_pos,
+            "players": {player.id: player.get_json() for player in self.player_datas.values()},
+        }
+        goal_tags = {player.id: player.team.goal_tag for player in self.player_datas.values()}
+        tracer.mark(timestamp, "vision")
+        self.socket_interface.publish_state(world, goal_tags)
+        tracer.mark(timestamp, "publish")
+        if self.recorder:
+            self.recorder.record(world, goal_tags)
 
     def run(self):
+        # `kill -USR1 <pid>` prints the latency histograms while running
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: tracer.dump())
+
         detection_thread = threading.Thread(target=self.camera_interface.run)
         detection_thread.start()
 
@@ -195,6 +336,11 @@ class Manager:
         serial_thread = threading.Thread(target=self.serial_interface.start)
         serial_thread.start()
 
+        control_thread = None
+        if self.control_loop:
+            control_thread = threading.Thread(target=self.control_loop.run)
+            control_thread.start()
+
         try:
             while True:
                 time.sleep(1)
@@ -205,8 +351,53 @@ class Manager:
             detection_thread.join(1)
             socket_thread.join(1)
             serial_thread.join(1)
+            if control_thread:
+                control_thread.join(1)
+            if self.recorder:
+                self.recorder.close()
+            tracer.dump()
 
     
 if __name__ == "__main__":
-    manager = Manager()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Game server")
+    parser.add_argument("--simulate", action="store_true", help="Simulated arena instead of the camera and robots")
+    parser.add_argument("--robots", type=int, default=len(player_ids))
+    parser.add_argument("--sim-rate", type=float, default=200, help="Simulation ticks per second")
+    parser.add_argument("--async-sockets", action="store_true")
+    parser.add_argument("--binary-serial", action="store_true", help="Binary packets to the radio bridge")
+    parser.add_argument("--serial-port", default=serial_port)
+    parser.add_argument("--record", help="Append every world snapshot to this state log")
+    parser.add_argument("--camera-config", help="Camera entity config, config2.json by default")
+    parser.add_argument("--source", default="0", help="Camera index, video file or image directory")
+    parser.add_argument("--paced-replay", action="store_true", help="Replay recordings at their recorded pace")
+    parser.add_argument("--record-frames", help="Save camera frames to this video file or directory")
+    parser.add_argument("--headless", action="store_true", help="No local window, skip warping and rendering")
+    parser.add_argument("--preview-port", type=int, help="Serve annotated frames on this port")
+    parser.add_argument("--pipelined", action="store_true", help="Capture frames on a separate thread")
+    parser.add_argument("--workers", action="store_true", help="Detect in worker processes")
+    parser.add_argument("--lut", action="store_true", help="Use the color lookup table")
+    parser.add_argument("--pyramid", type=float, help="Coarse-to-fine detection scale")
+    parser.add_argument("--pose-lead-time", type=float, default=0.0, help="Seconds to extrapolate poses ahead")
+    parser.add_argument("--profile-interval", type=float, help="Seconds between vision profile summaries, 0 for none")
+    args = parser.parse_args()
+
+    vision_options = {
+        "frame_source": int(args.source) if args.source.isdigit() else args.source,
+        "paced_replay": args.paced_replay,
+        "record_path": args.record_frames,
+        "headless": args.headless,
+        "preview_port": args.preview_port,
+        "pipelined": args.pipelined,
+        "use_workers": args.workers,
+        "use_color_lut": args.lut,
+        "pyramid_scale": args.pyramid,
+        "pose_lead_time": args.pose_lead_time,
+        "profile_interval": args.profile_interval,
+    }
+    manager = Manager(async_sockets=args.async_sockets, binary_serial=args.binary_serial, serial_port=args.serial_port,
+                      record_path=args.record, simulate=args.simulate, sim_rate=args.sim_rate,
+                      player_ids=[f"player{i + 1}" for i in range(args.robots)],
+                      camera_config=args.camera_config, vision_options=vision_options)
     manager.run()
\ No newline at end of file
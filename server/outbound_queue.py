@@ -0,0 +1,74 @@
+import threading
+from collections import deque
+
+STATE_KEY = "state"
+
+
+class OutboundQueue:
+    """
+    Bounded per-client send queue with a latest-state-wins policy.
+
+    A message put with a `key` replaces a queued message with the same key
+    (counted as coalesced), so a slow client only ever gets the newest game
+    state. When the queue is full the oldest message is dropped (counted as
+    dropped). put() never blocks, which keeps the vision loop off the network.
+    """
+    def __init__(self, max_depth=4):
+        self.max_depth = max_depth
+        self.condition = threading.Condition()
+        self.items = deque()  # [key, data] pairs
+        self.enqueued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.sent = 0
+
+    def put(self, data, key=None):
+        with self.condition:
+            self._put(data, key)
+            self.condition.notify()
+
+    def put_many(self, items):
+        """Queue (data, key) pairs at once, so a waiting reader never sees only part of them."""
+        with self.condition:
+            for data, key in items:
+                self._put(data, key)
+            self.condition.notify()
+
+    def _put(self, data, key):
+        self.enqueued += 1
+        if key is not None:
+            for item in self.items:
+                if item[0] == key:
+                    item[1] = data
+                    self.coalesced += 1
+                    return
+
+        if len(self.items) >= self.max_depth:
+            self.items.popleft()
+            self.dropped += 1
+        self.items.append([key, data])
+
+    def get(self, timeout=None):
+        """Wait for the next message, returns None on timeout."""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.items, timeout):
+                return None
+            self.sent += 1
+            return self.items.popleft()[1]
+
+    def get_nowait(self):
+        with self.condition:
+            if not self.items:
+                return None
+            self.sent += 1
+            return self.items.popleft()[1]
+
+    def get_stats(self):
+        with self.condition:
+            return {
+                "queued": len(self.items),
+                "enqueued": self.enqueued,
+                "sent": self.sent,
+                "coalesced": self.coalesced,
+                "dropped": self.dropped,
+            }
@@ -0,0 +1,223 @@
+import json
+import os
+import pty
+import random
+import select
+import threading
+import time
+import tty
+from serial_protocol import PKT_COMMANDS, PacketReader, decode_commands, encode_telemetry
+
+
+class SimulatedBridge:
+    """
+    Stand-in for the radio bridge on a pseudo-terminal, so SerialInterface
+    can run without hardware: pass `port` as its serial port.
+
+    It speaks the same JSON-line or binary protocol as broadcast_esp.ino.
+    Bytes are delivered no faster than `baud_rate` allows (10 bits per byte),
+    every command costs `processing_delay` seconds, and each robot reports
+    `ldr`/`succ` telemetry every `telemetry_interval` seconds. Unknown robot
+    ids are answered with {"succ": 0} like the firmware does.
+    """
+    def __init__(self, robot_ids, binary=False, baud_rate=115200, processing_delay=0.0,
+                 telemetry_interval=0.1, ldr=None, on_command=None):
+        self.robot_ids = list(robot_ids)
+        self.binary = binary
+        self.byte_time = 10.0 / baud_rate if baud_rate else 0.0
+        self.processing_delay = processing_delay
+        self.telemetry_interval = telemetry_interval
+        self.ldr = ldr or (lambda robot_id: random.randint(0, 1023))
+        self.on_command = on_command  # Called with (command, receive time) for every command
+
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+        self.running = False
+        self.write_lock = threading.Lock()
+        self.rx_free_at = 0.0  # When the simulated wire finishes delivering received bytes
+        self.tx_free_at = 0.0
+        self.commands = {}  # robot id -> latest command
+        self.commands_received = 0
+        self.bytes_received = 0
+        self.errors = 0
+        self.threads = []
+
+    def start(self):
+        self.running = True
+        self.threads = [threading.Thread(target=self.read_loop, daemon=True),
+                        threading.Thread(target=self.telemetry_loop, daemon=True)]
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        for thread in self.threads:
+            thread.join(1)
+        os.close(self.master)
+        os.close(self.slave)
+
+    def wire_delay(self, free_at, size):
+        """When `size` bytes sent now are fully on the other end, given the wire is busy until `free_at`."""
+        return max(time.time(), free_at) + size * self.byte_time
+
+    def sleep_until(self, moment):
+        delay = moment - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def read_loop(self):
+        reader = PacketReader()
+        buffer = b""
+        while self.running:
+            ready, _, _ = select.select([self.master], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                chunk = os.read(self.master, 4096)
+            except OSError:
+                break
+
+            self.bytes_received += len(chunk)
+            self.rx_free_at = self.wire_delay(self.rx_free_at, len(chunk))
+            self.sleep_until(self.rx_free_at)
+
+            if self.binary:
+                for packet_type, payload in reader.feed(chunk):
+                    if packet_type == PKT_COMMANDS:
+                        for command in decode_commands(payload, self.robot_ids):
+                            self.handle_command(command)
+                continue
+
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                try:
+                    self.handle_command(json.loads(line))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    self.reply_error()
+
+    def handle_command(self, command):
+        if self.processing_delay:
+            time.sleep(self.processing_delay)
+        if command.get("player_id") not in self.robot_ids:
+            self.reply_error()
+            return
+
+        self.commands[command["player_id"]] = command
+        self.commands_received += 1
+        if self.on_command:
+            self.on_command(command, time.time())
+
+    def reply_error(self):
+        self.errors += 1
+        if not self.binary:
+            self.write(b'{"succ": 0}\n')
+
+    def telemetry_loop(self):
+        while self.running:
+            for robot_id in self.robot_ids:
+                ldr = self.ldr(robot_id)
+                if self.binary:
+                    self.write(encode_telemetry(robot_id, ldr, True, self.robot_ids))
+                else:
+                    self.write((json.dumps({"id": robot_id, "ldr": ldr, "succ": 1}) + "\n").encode("utf-8"))
+            time.sleep(self.telemetry_interval)
+
+    def write(self, data):
+        with self.write_lock:
+            self.tx_free_at = self.wire_delay(self.tx_free_at, len(data))
+            self.sleep_until(self.tx_free_at)
+            try:
+                os.write(self.master, data)
+            except OSError:
+                pass
+
+    def get_stats(self):
+        return {
+            "commands": self.commands_received,
+            "bytes": self.bytes_received,
+            "errors": self.errors,
+        }
+
+
+def benchmark(robot_count=4, rate=50, duration=5.0, binary=False, baud_rate=115200, processing_delay=0.0):
+    """
+    Drive SerialInterface against a SimulatedBridge with one batch per tick
+    and report command throughput and write-to-receive latency.
+    """
+    from serial_interface import SerialInterface
+
+    robot_ids = [f"player{i + 1}" for i in range(robot_count)]
+    sent_at = {}
+    latencies = []
+
+    def on_command(command, received):
+        sent = sent_at.get(command["v"])
+        if sent is not None:
+            latencies.append(received - sent)
+
+    class Runner:
+        running = True
+
+        def process_serial_data(self, data):
+            pass
+
+    runner = Runner()
+    bridge = SimulatedBridge(robot_ids, binary=binary, baud_rate=baud_rate, processing_delay=processing_delay,
+                             on_command=on_command).start()
+    serial_interface = SerialInterface(runner, port=bridge.port, binary=binary, robot_ids=robot_ids)
+    serial_thread = threading.Thread(target=serial_interface.start)
+    serial_thread.start()
+    while not serial_interface.is_connected:
+        time.sleep(0.01)
+
+    tick = 0
+    end = time.time() + duration
+    while time.time() < end:
+        tick += 1
+        # The tick number rides in v so the bridge side can match it to its send time
+        sent_at[tick % 10000] = time.time()
+        serial_interface.send_batch([{"player_id": robot_id, "v": tick % 10000, "w": 0} for robot_id in robot_ids])
+        time.sleep(1.0 / rate)
+
+    time.sleep(0.5)
+    runner.running = False
+    serial_thread.join(2)
+    bridge.stop()
+
+    latencies.sort()
+    stats = dict(bridge.get_stats(), sent=tick * robot_count, serial=serial_interface.get_stats())
+    if latencies:
+        stats["latency_p50"] = latencies[len(latencies) // 2]
+        stats["latency_p99"] = latencies[int(len(latencies) * 0.99)]
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Simulated robot radio bridge on a pseudo-terminal")
+    parser.add_argument("--robots", type=int, default=4)
+    parser.add_argument("--binary", action="store_true")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--delay", type=float, default=0.0, help="Processing delay per command in seconds")
+    parser.add_argument("--benchmark", type=float, metavar="SECONDS", help="Run the serial benchmark instead")
+    parser.add_argument("--rate", type=int, default=50, help="Command batches per second in the benchmark")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print(benchmark(args.robots, args.rate, args.benchmark, args.binary, args.baud, args.delay))
+    else:
+        bridge = SimulatedBridge([f"player{i + 1}" for i in range(args.robots)], binary=args.binary,
+                                 baud_rate=args.baud, processing_delay=args.delay).start()
+        print(f"Simulated bridge listening on {bridge.port}")
+        try:
+            while True:
+                time.sleep(1)
+                print(bridge.get_stats())
+        except KeyboardInterrupt:
+            bridge.stop()
@@ -1,58 +1,128 @@
 import serial
 import json
-import time
-import queue
+import threading
+from outbound_queue import OutboundQueue
+from serial_protocol import PKT_TELEMETRY, PacketReader, encode_commands, decode_telemetry
+from latency_tracer import tracer
 
 serial_port = "/dev/cu.usbserial-0001"
 baud_rate = 115200
 
 class SerialInterface:
-    def __init__(self, manager, port=serial_port, baud_rate=baud_rate):
+    """
+    Serial link to the robots' radio bridge.
+
+    A reader thread blocks on incoming telemetry lines and the writer blocks
+    on the outbox, so each side wakes as soon as there is something to do.
+    The outbox keeps one slot per robot: a newer command for a robot replaces
+    one that has not been written yet, so only the latest command goes out.
+
+    With `binary` the pending commands of all robots are packed into one
+    checksummed packet (see serial_protocol), robots being addressed by their
+    index in `robot_ids`. Otherwise commands go out as JSON lines, which is
+    what older bridge firmware understands.
+    """
+    def __init__(self, manager, port=serial_port, baud_rate=baud_rate, max_robots=16, binary=False, robot_ids=()):
         self.manager = manager
         self.port = port
         self.baud_rate = baud_rate
         self.is_connected = False
-        self.data_queue = queue.Queue()
+        # One slot per robot, so every robot keeps its latest command however many there are
+        self.data_queue = OutboundQueue(max_depth=max(len(robot_ids), max_robots))
+        self.binary = binary
+        self.robot_ids = list(robot_ids)
+        self.packet_reader = PacketReader()
 
     def send_data(self, data):
-        """Add data to the queue to be sent over serial."""
+        """Queue a command to be sent over serial, replacing any unsent one for the same robot."""
         if not self.is_connected:
             return
-        
-        print(f"Sending data to serial: {data}")
-        self.data_queue.put(data)
+
+        self.data_queue.put(data, data.get("player_id"))
+
+    def send_batch(self, commands):
+        """Queue one control tick's commands, they go out together in a single write."""
+        if not self.is_connected or not commands:
+            return
+
+        self.data_queue.put_many((data, data.get("player_id")) for data in commands)
+
+    def get_stats(self):
+        return self.data_queue.get_stats()
+
+    def handle_telemetry(self, data):
+        if data.get('succ', False):
+            self.manager.process_serial_data(data)
+        else:
+            print(f"Error received from serial: {data}")
+
+    def read_loop(self, ser):
+        """Blocks on incoming data, the serial timeout bounds how long a shutdown waits."""
+        while self.manager.running and self.is_connected:
+            try:
+                if self.binary:
+                    chunk = ser.read(max(1, ser.in_waiting))
+                else:
+                    chunk = ser.readline()
+            except serial.SerialException as e:
+                print(f"Serial read error: {e}")
+                break
+            if not chunk:
+                continue
+
+            if self.binary:
+                for packet_type, payload in self.packet_reader.feed(chunk):
+                    if packet_type != PKT_TELEMETRY:
+                        continue
+                    data = decode_telemetry(payload, self.robot_ids)
+                    if data is None:
+                        print(f"Dropped telemetry packet: {payload.hex()}")
+                        continue
+                    self.handle_telemetry(data)
+                continue
+
+            line = chunk.decode('utf-8', errors='replace').strip()
+            try:
+                self.handle_telemetry(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"Invalid JSON received: {line}")
+
+    def encode(self, commands):
+        if self.binary:
+            return encode_commands(commands, self.robot_ids)
+        return b"".join((json.dumps(command) + '\n').encode('utf-8') for command in commands)
+
+    def write_loop(self, ser):
+        while self.manager.running and self.is_connected:
+            data = self.data_queue.get(timeout=0.5)
+            if data is None:
+                continue
+            # Everything else already queued goes out in the same write
+            commands = [data]
+            while (data := self.data_queue.get_nowait()) is not None:
+                commands.append(data)
+            # Trace ids are for latency tracing only, they are not sent to the bridge
+            traces = [command.pop("trace", None) for command in commands]
+            ser.write(self.encode(commands))
+            for trace in traces:
+                tracer.mark(trace, "serial_write")
 
     def start(self):
         """Main loop for handling serial communication."""
         try:
-            with serial.Serial(self.port, self.baud_rate, timeout=1) as ser:
+            with serial.Serial(self.port, self.baud_rate, timeout=0.5) as ser:
                 self.is_connected = True
                 print(f"Connected to serial port {self.port} at {self.baud_rate} baud")
 
-                while self.manager.running:
-                    # Read from serial if data is available
-                    if ser.in_waiting > 0:
-                        line = ser.readline().decode('utf-8').strip()
-                        try:
-                            data = json.loads(line)
-                            if data.get('succ', False):
-                                self.manager.process_serial_data(data)
-                            else:
-                                print(f"Error received from serial: {data}")
-                        except json.JSONDecodeError:
-                            print(f"Invalid JSON received: {line}")
-
-                    # Write to serial if there's data in the queue
-                    if not self.data_queue.empty():
-                        data = self.data_queue.get()
-                        json_data = json.dumps(data)
-                        ser.write((json_data + '\n').encode('utf-8'))
-
-                    # Sleep to prevent high CPU usage
-                    time.sleep(0.1)
+                reader = threading.Thread(target=self.read_loop, args=(ser,), daemon=True)
+                reader.start()
+                try:
+                    self.write_loop(ser)
+                finally:
+                    self.is_connected = False
+                    reader.join(1)
         except serial.SerialException as e:
             print(f"Serial error: {e}")
         finally:
             self.is_connected = False
             print("Serial connection closed.")
-
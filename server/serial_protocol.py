@@ -0,0 +1,123 @@
+"""
+Binary packet format for the serial link to the radio bridge.
+
+A packet is SYNC, a 1-byte packet type, a 1-byte payload length, the
+payload and a CRC-8 over type, length and payload. One PKT_COMMANDS packet
+carries a (robot index, v, w) record for every robot, so all robots get
+their commands in the same tick; PKT_TELEMETRY carries one robot's LDR
+reading. Robots are addressed by their index in the bridge's player list.
+Integers are little-endian to match the ESP32.
+
+server/broadcast_esp/broadcast_esp.ino implements the other end.
+"""
+import struct
+
+SYNC = b"\xaa\x55"
+HEADER = struct.Struct("<BB")  # packet type, payload length
+COMMAND = struct.Struct("<Bhh")  # robot index, v, w
+TELEMETRY = struct.Struct("<BHB")  # robot index, ldr, succ
+MAX_PAYLOAD = 255
+
+PKT_COMMANDS = 0x01
+PKT_TELEMETRY = 0x02
+
+
+def _crc8_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return table
+
+
+CRC8_TABLE = _crc8_table()
+
+
+def crc8(data):
+    """CRC-8 with polynomial 0x07."""
+    crc = 0
+    for byte in data:
+        crc = CRC8_TABLE[crc ^ byte]
+    return crc
+
+
+def encode_packet(packet_type, payload):
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError(f"Serial payload of {len(payload)} bytes is too large")
+    body = HEADER.pack(packet_type, len(payload)) + payload
+    return SYNC + body + bytes((crc8(body),))
+
+
+def encode_commands(commands, robot_ids):
+    """One packet with the {"player_id", "v", "w"} commands of every robot in `commands`."""
+    payload = b"".join(COMMAND.pack(robot_ids.index(command["player_id"]), command["v"], command["w"])
+                       for command in commands if command["player_id"] in robot_ids)
+    return encode_packet(PKT_COMMANDS, payload)
+
+
+def decode_commands(payload, robot_ids):
+    commands = []
+    for offset in range(0, len(payload) - COMMAND.size + 1, COMMAND.size):
+        index, v, w = COMMAND.unpack_from(payload, offset)
+        if index < len(robot_ids):
+            commands.append({"player_id": robot_ids[index], "v": v, "w": w})
+    return commands
+
+
+def encode_telemetry(player_id, ldr, succ, robot_ids):
+    index = robot_ids.index(player_id) if player_id in robot_ids else 0xFF
+    return encode_packet(PKT_TELEMETRY, TELEMETRY.pack(index, ldr, int(succ)))
+
+
+def decode_telemetry(payload, robot_ids):
+    """
+    Telemetry in the same shape as the JSON lines: {"id", "ldr", "succ"}.
+    Returns None for a payload of the wrong size or a robot index outside `robot_ids`.
+    """
+    if len(payload) != TELEMETRY.size:
+        return None
+    index, ldr, succ = TELEMETRY.unpack(payload)
+    if index >= len(robot_ids):
+        return None
+    return {"id": robot_ids[index], "ldr": ldr, "succ": bool(succ)}
+
+
+class PacketReader:
+    """
+    Finds packets in a serial byte stream. Bytes before a SYNC and packets
+    with a bad checksum are skipped (counted in `corrupt`).
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+        self.corrupt = 0
+
+    def feed(self, data):
+        """Returns the (packet type, payload) pairs completed by `data`."""
+        self.buffer += data
+        packets = []
+        while True:
+            start = self.buffer.find(SYNC)
+            if start < 0:
+                # Keep a trailing byte that could be the start of SYNC
+                del self.buffer[:max(0, len(self.buffer) - 1)]
+                return packets
+            del self.buffer[:start]
+
+            header_end = len(SYNC) + HEADER.size
+            if len(self.buffer) < header_end:
+                return packets
+            packet_type, length = HEADER.unpack_from(self.buffer, len(SYNC))
+            end = header_end + length + 1
+            if len(self.buffer) < end:
+                return packets
+
+            body = bytes(self.buffer[len(SYNC):end - 1])
+            if crc8(body) == self.buffer[end - 1]:
+                packets.append((packet_type, body[HEADER.size:]))
+                del self.buffer[:end]
+            else:
+                # Not a real packet, resync from the next byte
+                self.corrupt += 1
+                del self.buffer[:1]
@@ -0,0 +1,217 @@
+import math
+import threading
+import time
+
+from camera.arena_entity import EntityType as VisionEntityType
+from control_loop import ControlLoop
+
+
+class SimBody:
+    def __init__(self, x, y, radius, yaw=0.0):
+        self.x = x
+        self.y = y
+        self.yaw = yaw
+        self.radius = radius
+        self.vx = 0.0
+        self.vy = 0.0
+        self.yaw_rate = 0.0
+
+
+class ArenaSimulator:
+    """
+    Headless stand-in for both the camera and the radio.
+
+    Robots are differential-drive bodies driven by the {"player_id", "v", "w"}
+    commands Manager.validate_response produces, the ball is pushed by robot
+    contact, slowed by friction and bounced off the walls, and a ball inside
+    a goal counts as a goal and is put back on the centre spot. Every tick
+    the poses are handed to Manager.process_frame in the same response format
+    ComputerVisionManager produces, so everything downstream runs unchanged.
+    Plug it in with Manager(simulate=True): the simulator replaces the camera
+    interface and `serial` replaces the serial interface.
+    """
+    def __init__(self, manager, robot_ids, goal_tags=None, width=1000, height=1000, rate=200,
+                 speed_per_unit=-20.0, turn_per_unit=0.3, robot_radius=40, ball_radius=20,
+                 ball_friction=0.6, restitution=0.8, goal_width=300, goal_depth=60):
+        self.manager = manager
+        self.robot_ids = list(robot_ids)
+        self.width = width
+        self.height = height
+        self.rate = rate
+        # validate_response negates the player's velocity for the motor wiring, a negative
+        # scale turns it back into forward motion
+        self.speed_per_unit = speed_per_unit
+        self.turn_per_unit = turn_per_unit
+        self.ball_friction = ball_friction  # Fraction of ball speed lost per second
+        self.restitution = restitution
+
+        self.goals = {
+            "red_goal": (0, (height - goal_width) / 2, goal_depth, (height + goal_width) / 2),
+            "blue_goal": (width - goal_depth, (height - goal_width) / 2, width, (height + goal_width) / 2),
+        }
+        self.goal_tags = goal_tags or {}  # player id -> goal its team attacks
+        self.score = {name: 0 for name in self.goals}
+
+        self.lock = threading.Lock()
+        self.commands = {robot_id: (0, 0) for robot_id in self.robot_ids}
+        self.robots = {}
+        for i, robot_id in enumerate(self.robot_ids):
+            # First half of the players on the left facing right, the rest on the right facing left
+            left = i < (len(self.robot_ids) + 1) // 2
+            row = i if left else i - (len(self.robot_ids) + 1) // 2
+            rows = max(1, (len(self.robot_ids) + 1) // 2)
+            x = width * (0.25 if left else 0.75)
+            y = height * (row + 1) / (rows + 1)
+            self.robots[robot_id] = SimBody(x, y, robot_radius, 0.0 if left else math.pi)
+        self.ball = SimBody(width / 2, height / 2, ball_radius)
+
+        self.ticks = 0
+        self.control_loop = ControlLoop(rate, self.tick, lambda: self.manager.running)
+        self.serial = SimulatedSerial(self)
+
+    def set_command(self, robot_id, v, w):
+        with self.lock:
+            if robot_id in self.commands:
+                self.commands[robot_id] = (v, w)
+
+    def step(self, dt):
+        with self.lock:
+            commands = dict(self.commands)
+
+        for robot_id, robot in self.robots.items():
+            v, w = commands[robot_id]
+            speed = v * self.speed_per_unit
+            robot.yaw_rate = w * self.turn_per_unit
+            robot.yaw = (robot.yaw + robot.yaw_rate * dt + math.pi) % (2 * math.pi) - math.pi
+            robot.vx = speed * math.cos(robot.yaw)
+            robot.vy = speed * math.sin(robot.yaw)
+            robot.x = min(max(robot.x + robot.vx * dt, robot.radius), self.width - robot.radius)
+            robot.y = min(max(robot.y + robot.vy * dt, robot.radius), self.height - robot.radius)
+
+        self.separate_robots()
+
+        ball = self.ball
+        decay = (1.0 - self.ball_friction) ** dt
+        ball.vx *= decay
+        ball.vy *= decay
+        ball.x += ball.vx * dt
+        ball.y += ball.vy * dt
+        for robot in self.robots.values():
+            self.collide_with_ball(robot)
+        self.bounce_off_walls(ball)
+        self.check_goals()
+
+    def separate_robots(self):
+        robots = list(self.robots.values())
+        for i, a in enumerate(robots):
+            for b in robots[i + 1:]:
+                dx, dy = b.x - a.x, b.y - a.y
+                distance = math.hypot(dx, dy)
+                overlap = a.radius + b.radius - distance
+                if overlap > 0 and distance > 0:
+                    nx, ny = dx / distance, dy / distance
+                    a.x -= nx * overlap / 2
+                    a.y -= ny * overlap / 2
+                    b.x += nx * overlap / 2
+                    b.y += ny * overlap / 2
+
+    def collide_with_ball(self, robot):
+        """Robots are far heavier than the ball: it is pushed out and bounces off them."""
+        ball = self.ball
+        dx, dy = ball.x - robot.x, ball.y - robot.y
+        distance = math.hypot(dx, dy)
+        overlap = robot.radius + ball.radius - distance
+        if overlap <= 0 or distance == 0:
+            return
+        nx, ny = dx / distance, dy / distance
+        ball.x += nx * overlap
+        ball.y += ny * overlap
+        approach = (ball.vx - robot.vx) * nx + (ball.vy - robot.vy) * ny
+        if approach < 0:
+            ball.vx -= (1 + self.restitution) * approach * nx
+            ball.vy -= (1 + self.restitution) * approach * ny
+
+    def bounce_off_walls(self, body):
+        if body.x < body.radius or body.x > self.width - body.radius:
+            body.x = min(max(body.x, body.radius), self.width - body.radius)
+            body.vx = -body.vx * self.restitution
+        if body.y < body.radius or body.y > self.height - body.radius:
+            body.y = min(max(body.y, body.radius), self.height - body.radius)
+            body.vy = -body.vy * self.restitution
+
+    def check_goals(self):
+        ball = self.ball
+        for name, (x0, y0, x1, y1) in self.goals.items():
+            if x0 <= ball.x <= x1 and y0 <= ball.y <= y1:
+                self.score[name] += 1
+                scorers = [player_id for player_id, goal in self.goal_tags.items() if goal == name]
+                print(f"Goal in {name} by {', '.join(scorers) or 'nobody'}, score {self.score}")
+                ball.x, ball.y = self.width / 2, self.height / 2
+                ball.vx = ball.vy = 0.0
+
+    def response(self, timestamp):
+        """Poses in the format of ComputerVisionManager.response_model."""
+        response = []
+        for index, (robot_id, robot) in enumerate(self.robots.items()):
+            response.append(self.body_entry(index, robot_id, robot, VisionEntityType.PLAYER, timestamp))
+        response.append(self.body_entry(len(self.robots), "ball", self.ball, VisionEntityType.OBJECT, timestamp))
+        for name, (x0, y0, x1, y1) in self.goals.items():
+            response.append({
+                "id": name, "pose": (0, 0, 0, 0, 0, 0), "velocity": (0, 0, 0, 0, 0, 0), "timestamp": timestamp,
+                "object_type": VisionEntityType.REGION, "tag": name, "mobility": "fixed",
+                "options": {"boundary_points": [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]},
+            })
+        response.append({
+            "id": "boundary", "pose": (0, 0, 0, 0, 0, 0), "velocity": (0, 0, 0, 0, 0, 0), "timestamp": timestamp,
+            "object_type": VisionEntityType.BOUNDARY, "tag": "boundary_polygon", "mobility": "fixed",
+            "options": {"boundary_points": [(0, 0), (self.width, 0), (self.width, self.height), (0, self.height)]},
+        })
+        return response
+
+    def body_entry(self, index, tag, body, object_type, timestamp):
+        return {
+            "id": index,
+            "pose": (body.x, body.y, 0, 0, 0, body.yaw),
+            "velocity": (body.vx, body.vy, 0, 0, 0, body.yaw_rate),
+            "timestamp": timestamp,
+            "object_type": object_type,
+            "tag": tag,
+            "mobility": "dynamic",
+            "options": {},
+        }
+
+    def tick(self):
+        self.step(1.0 / self.rate)
+        self.ticks += 1
+        self.manager.process_frame(self.response(time.time()), None)
+
+    def run(self):
+        """Camera-interface entry point, publishes poses at `rate` Hz until the manager stops."""
+        print(f"Simulating {len(self.robots)} robots at {self.rate} Hz")
+        self.control_loop.run()
+
+    def get_stats(self):
+        return dict(self.control_loop.get_stats(), score=dict(self.score))
+
+
+class SimulatedSerial:
+    """Serial-interface stand-in that hands robot commands straight to the simulator."""
+    def __init__(self, simulator):
+        self.simulator = simulator
+        self.is_connected = True
+        self.commands = 0
+
+    def send_data(self, data):
+        self.commands += 1
+        self.simulator.set_command(data["player_id"], data["v"], data["w"])
+
+    def send_batch(self, commands):
+        for data in commands:
+            self.send_data(data)
+
+    def get_stats(self):
+        return {"sent": self.commands}
+
+    def start(self):
+        while self.simulator.manager.running:
+            time.sleep(0.2)
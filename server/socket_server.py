@@ -1,6 +1,11 @@
 import socket
 import threading
-import json
+from protocol import (HELLO, hello_incomplete, ENCODINGS, ENCODING_JSON, ENCODING_BINARY, make_hello, parse_hello,
+                      FrameReader, JSONStreamReader, ProtocolError, MessageError)
+from outbound_queue import OutboundQueue, STATE_KEY
+from state_encoder import StateEncoder, serialize_message, state_trace
+from udp_state_channel import UDPStatePublisher
+from latency_tracer import tracer
 
 default_socket_response = {
     "player_id": "player1",
@@ -14,23 +19,76 @@ player_socket_map = {}
 
 class SocketClient:
     """Handles communication with a specific client."""
-    def __init__(self, manager, client_socket, client_address):
+    def __init__(self, manager, client_socket, client_address, udp_publisher=None):
         self.manager = manager
+        self.udp_publisher = udp_publisher
         self.client_socket = client_socket
         self.client_address = client_address
         self.active = True
         self.player_id = ""
+        self.spectator = False  # Spectators receive the whole world instead of a player's view
+        self.acked_snapshot = None  # Last state snapshot the client acknowledged, enables deltas
+        self.udp_address = None  # Set when the client takes game state over UDP instead of TCP
+        self.encoding = None  # None for legacy unframed JSON, otherwise the negotiated frame encoding
+        self.send_lock = threading.Lock()
+        self.close_lock = threading.Lock()
+        self.outbox = OutboundQueue()
         
         threading.Thread(target=self.handle_client).start()
+        threading.Thread(target=self.write_loop, daemon=True).start()
+
+    def negotiate(self):
+        """
+        Reads the start of the stream. A protocol hello switches the connection
+        to framed messages, anything else is treated as a legacy JSON client.
+        Returns the reader to use and the bytes left over after the hello.
+        """
+        data = b""
+        while hello_incomplete(data):
+            chunk = self.client_socket.recv(1024)
+            if not chunk:
+                return None, b""
+            data += chunk
+
+        try:
+            version, encoding = parse_hello(data)
+        except ProtocolError:
+            return JSONStreamReader(), data
+
+        self.encoding = encoding if encoding in ENCODINGS else ENCODING_JSON
+        with self.send_lock:
+            self.client_socket.sendall(make_hello(self.encoding))
+        print(f"Client {self.client_address} negotiated protocol v{version}, encoding {self.encoding}")
+        return FrameReader(), data[HELLO.size:]
 
     def handle_client(self):
         """Handles communication with the client."""
         try:
-            while self.active:
-                data = self.client_socket.recv(1024)
+            reader, data = self.negotiate()
+            while self.active and reader:
                 if data:
                     try:
-                        json_data = json.loads(data.decode())
+                        messages = reader.feed(data)
+                    except MessageError as e:
+                        # The bad message is skipped, everything decoded around it is still handled
+                        print(f"Failed to decode message from {self.client_address}: {e}")
+                        self.send_data({"error": str(e)})
+                        messages = e.messages
+
+                    for json_data in messages:
+                        if "ack" in json_data:
+                            self.acked_snapshot = json_data["ack"]
+                            continue
+                        if "udp_port" in json_data:
+                            self.udp_address = (self.client_address[0], json_data["udp_port"])
+                            self.udp_publisher.subscribe(self.udp_address)
+                            print(f"Client {self.client_address} takes state over UDP on {self.udp_address}")
+                            continue
+                        if json_data.get("spectator"):
+                            self.spectator = True
+                            print(f"Client {self.client_address} is spectating")
+                            continue
+
                         if not self.player_id:
                             self.player_id = json_data.get("player_id", "")
 
@@ -38,30 +96,62 @@ class SocketClient:
                             print(f"Client {self.client_address} identified as {self.player_id}")
                         
                         self.manager.process_player_data(json_data)
-                    except json.JSONDecodeError:
-                        print(f"Failed to decode JSON from {self.client_address}: {data.decode()}")
-                        self.send_data({"error": "Invalid JSON format"})
-                else:
+
+                data = self.client_socket.recv(4096)
+                if not data:
                     break
+        except ProtocolError as e:
+            print(f"Protocol error from {self.client_address}: {e}")
+        except OSError:
+            pass
         finally:
             self.close_connection()
 
-    def send_data(self, data):
-        """Sends data to the client."""
+    def delta_base(self):
+        """
+        Snapshot to send the next state as a delta against. Deltas are JSON, so
+        binary player connections always get full states, which are smaller.
+        """
+        if self.encoding == ENCODING_BINARY and self.player_id:
+            return None
+        return self.acked_snapshot
+
+    def send_data(self, data, key=None):
+        """Queues data for the client, never blocks. See OutboundQueue for `key`."""
         if self.active:
-            json_data = json.dumps(data)
-            self.client_socket.sendall(json_data.encode('utf-8'))
+            self.outbox.put(data, key)
+
+    def write_loop(self):
+        """Drains the outbound queue onto the socket."""
+        try:
+            while self.active:
+                data = self.outbox.get(timeout=0.5)
+                if data is None:
+                    continue
+                payload = serialize_message(data, self.encoding)
+                with self.send_lock:
+                    self.client_socket.sendall(payload)
+                tracer.mark(state_trace(data), "state_sent")
+        except OSError:
+            self.close_connection()
     
     def close_connection(self):
         """Closes the connection with the client."""
-        self.active = False
-        self.client_socket.close()
+        with self.close_lock:
+            if not self.active:
+                return
+            self.active = False
+            if self.udp_address:
+                self.udp_publisher.unsubscribe(self.udp_address)
+            self.client_socket.close()
+            if player_socket_map.get(self.player_id) is self:
+                del player_socket_map[self.player_id]
         print(f"Connection to {self.client_address} closed.")
 
 
 class SocketInterface:
     """Handles the server socket interface."""
-    def __init__(self, manager, host='127.0.0.1', port=65432):
+    def __init__(self, manager, host='127.0.0.1', port=65432, multicast_group=None):
         self.manager = manager
         self.host = host
         self.port = port
@@ -69,21 +159,45 @@ class SocketInterface:
         self.server_socket.bind((host, port))
         self.server_socket.listen(5)
         self.clients = []
+        self.state_encoder = StateEncoder()
+        self.udp_publisher = UDPStatePublisher(multicast_group)
 
     def send_to_client(self, client_name, data):
-        """Sends data to a specific client."""
+        """Queues game state for a specific client, replacing any state it has not been sent yet."""
         client = player_socket_map.get(client_name)
         if client:
-            client.send_data(data)
+            client.send_data(data, STATE_KEY)
         else:
             # print(f"Client {client_name} not found.")
             pass
 
+    def publish_state(self, world, goal_tags):
+        """
+        Sends one world snapshot to every player and spectator. Shared parts
+        are serialized once, see StateEncoder.
+        """
+        self.udp_publisher.publish(world, goal_tags)
+        self.state_encoder.begin_frame(world, goal_tags)
+        for client in list(self.clients):
+            if not client.active:
+                # Closed clients are dropped here, the accept loop only ever adds
+                self.state_encoder.forget(client)
+                if client in self.clients:
+                    self.clients.remove(client)
+            elif (client.player_id or client.spectator) and not client.udp_address:
+                message = self.state_encoder.message_for(client, client.player_id, client.delta_base())
+                client.send_data(message, STATE_KEY)
+
     def broadcast_to_clients(self, data):
         """Sends data to all connected clients."""
-        for client in self.clients:
+        for client in list(self.clients):
             client.send_data(data)
 
+    def get_send_stats(self):
+        """Outbound queue counters per connected client."""
+        return {client.player_id or str(client.client_address): client.outbox.get_stats()
+                for client in list(self.clients) if client.active}
+
     def run_server(self):
         """Accepts incoming client connections."""
         print(f"Server started. Listening on {self.host}:{self.port}...")
@@ -92,15 +206,16 @@ class SocketInterface:
                 client_socket, client_address = self.server_socket.accept()
                 print(f"Connection from {client_address} established!")
 
-                client_handler = SocketClient(self.manager, client_socket, client_address)
+                client_handler = SocketClient(self.manager, client_socket, client_address, self.udp_publisher)
                 self.clients.append(client_handler)
         except KeyboardInterrupt:
             print("Server shutting down...")
         except Exception as e:
             print(f"Server error: {e}")
         finally:
-            for client in self.clients:
+            for client in list(self.clients):
                 client.close_connection()
 
             self.server_socket.close()
+            self.udp_publisher.close()
             print("Socket Server closed.")
@@ -0,0 +1,115 @@
+import json
+from collections import OrderedDict
+from protocol import encode_message
+
+
+class EncodedState:
+    """A state message together with its already serialized JSON payload."""
+    def __init__(self, data, json_payload):
+        self.data = data
+        self.json_payload = json_payload
+
+
+def serialize_message(data, encoding):
+    """Bytes to write for `data` on a connection using `encoding` (None for legacy JSON)."""
+    json_payload = None
+    if isinstance(data, EncodedState):
+        data, json_payload = data.data, data.json_payload
+
+    if encoding is None:
+        return json_payload or json.dumps(data).encode('utf-8')
+    return encode_message(data, encoding, json_payload)
+
+
+def state_trace(data):
+    """Capture timestamp of the frame a state message was built from, None for other messages."""
+    if isinstance(data, EncodedState):
+        data = data.data
+    if not isinstance(data, dict):
+        return None
+    return data.get("delta", data).get("timestamp")
+
+
+class StateEncoder:
+    """
+    Turns one world snapshot per frame into the per-client state messages.
+
+    The parts of the state that clients share (ball, goals and timestamp per
+    team, the whole world for spectators) are serialized once per frame and
+    spliced together with a small per-player segment. Clients that
+    acknowledge snapshots get deltas holding only the top-level fields that
+    changed since their last acknowledged snapshot.
+    """
+    def __init__(self, history=32):
+        self.history_size = history
+        self.snapshot = 0
+        self.world = None
+        self.goal_tags = {}
+        self.fragments = {}
+        self.history = {}  # client -> OrderedDict(snapshot id -> fields sent)
+
+    def begin_frame(self, world, goal_tags):
+        """
+        Start a new snapshot. `world` holds "timestamp", "ball", "goals" and
+        "players"; `goal_tags` maps each player id to the goal it attacks.
+        """
+        self.snapshot += 1
+        self.world = world
+        self.goal_tags = goal_tags
+        self.fragments = {}
+
+    def forget(self, client):
+        self.history.pop(client, None)
+
+    def fields_for(self, player_id):
+        """Top-level fields of the message a client gets, the whole world for spectators."""
+        if player_id not in self.world["players"]:
+            return self.world
+        fields = self.team_fields(self.goal_tags[player_id])
+        return dict(fields, player=self.world["players"][player_id])
+
+    def team_fields(self, goal_tag):
+        ball = self.world["ball"]
+        return {
+            "target_pos": ball["pos"],
+            "target_velocity": ball["velocity"],
+            "goal_pos": self.world["goals"][goal_tag],
+            "timestamp": self.world["timestamp"],
+        }
+
+    def shared_fragment(self, key, fields):
+        """JSON of `fields` plus the snapshot id, serialized once per frame and key."""
+        fragment = self.fragments.get(key)
+        if fragment is None:
+            fragment = json.dumps(dict(fields, snapshot=self.snapshot)).encode('utf-8')
+            self.fragments[key] = fragment
+        return fragment
+
+    def full_payload(self, player_id):
+        if player_id not in self.world["players"]:
+            return self.shared_fragment(None, self.world)
+
+        goal_tag = self.goal_tags[player_id]
+        fragment = self.shared_fragment(goal_tag, self.team_fields(goal_tag))
+        player_json = json.dumps(self.world["players"][player_id]).encode('utf-8')
+        # Splice the player segment in front of the shared team fields
+        return b'{"player": ' + player_json + b', ' + fragment[1:]
+
+    def message_for(self, client, player_id, acked=None):
+        """Build the EncodedState for one client, as a delta against `acked` when possible."""
+        fields = self.fields_for(player_id)
+        history = self.history.setdefault(client, OrderedDict())
+        base = history.get(acked) if acked is not None else None
+
+        if base is None:
+            data = dict(fields, snapshot=self.snapshot)
+            message = EncodedState(data, self.full_payload(player_id))
+        else:
+            delta = {key: value for key, value in fields.items() if base.get(key) != value}
+            data = {"snapshot": self.snapshot, "base": acked, "delta": delta}
+            message = EncodedState(data, json.dumps(data).encode('utf-8'))
+
+        history[self.snapshot] = fields
+        while len(history) > self.history_size:
+            history.popitem(last=False)
+        return message
@@ -0,0 +1,312 @@
+"""
+Binary log of world snapshots and a replay server for it.
+
+A log starts with MAGIC, a version and a JSON layout naming the players and
+goals, followed by fixed-size records: the capture timestamp, ball pose and
+velocity, every goal polygon (padded to `max_goal_points`) and every
+player's pose, velocity, timestamp and boost flag. Fixed records let
+StateLog memory-map a log and jump to any snapshot by index or time without
+reading what comes before it.
+"""
+import bisect
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+MAGIC = b"ZREC"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sBI")  # magic, version, layout length
+
+ZERO_POSE = (0, 0, 0, 0, 0, 0)
+
+
+def _time(value):
+    return math.nan if value is None else float(value)
+
+
+def _untime(value):
+    return None if math.isnan(value) else value
+
+
+class RecordLayout:
+    """Field order of one record, fixed per log from the first snapshot recorded."""
+    def __init__(self, player_ids, goal_names, goal_tags, max_goal_points=8):
+        self.player_ids = list(player_ids)
+        self.goal_names = list(goal_names)
+        self.goal_tags = dict(goal_tags)
+        self.max_goal_points = max_goal_points
+
+        goal_format = "B" + "f" * (2 * max_goal_points)
+        player_format = "12fd?"
+        self.record = struct.Struct("<d12f" + goal_format * len(self.goal_names) + player_format * len(self.player_ids))
+
+    @classmethod
+    def for_world(cls, world, goal_tags, max_goal_points=8):
+        return cls(world["players"], world["goals"], goal_tags, max_goal_points)
+
+    def to_json(self):
+        return json.dumps({
+            "player_ids": self.player_ids,
+            "goal_names": self.goal_names,
+            "goal_tags": self.goal_tags,
+            "max_goal_points": self.max_goal_points,
+        }).encode("utf-8")
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(**json.loads(data.decode("utf-8")))
+
+    def pack(self, world):
+        ball = world["ball"]
+        values = [_time(world.get("timestamp")), *ball["pos"], *ball.get("velocity", ZERO_POSE)]
+        for name in self.goal_names:
+            points = list(world["goals"].get(name, []))[:self.max_goal_points]
+            values.append(len(points))
+            for x, y in points:
+                values.extend((x, y))
+            values.extend([0.0] * (2 * (self.max_goal_points - len(points))))
+        for player_id in self.player_ids:
+            player = world["players"].get(player_id, {})
+            values.extend(player.get("pos", ZERO_POSE))
+            values.extend(player.get("velocity", ZERO_POSE))
+            values.append(_time(player.get("timestamp")))
+            values.append(bool(player.get("boost_available", False)))
+        return self.record.pack(*values)
+
+    def unpack(self, buffer, offset=0):
+        values = self.record.unpack_from(buffer, offset)
+        world = {
+            "timestamp": _untime(values[0]),
+            "ball": {"pos": values[1:7], "velocity": values[7:13]},
+            "goals": {},
+            "players": {},
+        }
+        index = 13
+        for name in self.goal_names:
+            count = values[index]
+            coords = values[index + 1:index + 1 + 2 * count]
+            world["goals"][name] = [(coords[i], coords[i + 1]) for i in range(0, len(coords), 2)]
+            index += 1 + 2 * self.max_goal_points
+        for player_id in self.player_ids:
+            world["players"][player_id] = {
+                "id": player_id,
+                "pos": values[index:index + 6],
+                "velocity": values[index + 6:index + 12],
+                "timestamp": _untime(values[index + 12]),
+                "boost_available": values[index + 13],
+            }
+            index += 14
+        return world
+
+
+class StateRecorder:
+    """Appends world snapshots to a log. The layout is taken from the first snapshot."""
+    def __init__(self, path, max_goal_points=8, flush_interval=1.0):
+        self.path = path
+        self.max_goal_points = max_goal_points
+        self.flush_interval = flush_interval
+        self.file = open(path, "wb")
+        self.layout = None
+        self.records = 0
+        self.last_flush = time.time()
+
+    def record(self, world, goal_tags):
+        if self.layout is None:
+            self.layout = RecordLayout.for_world(world, goal_tags, self.max_goal_points)
+            layout = self.layout.to_json()
+            self.file.write(FILE_HEADER.pack(MAGIC, VERSION, len(layout)) + layout)
+
+        self.file.write(self.layout.pack(world))
+        self.records += 1
+        now = time.time()
+        if now - self.last_flush > self.flush_interval:
+            self.file.flush()
+            self.last_flush = now
+
+    def close(self):
+        self.file.close()
+
+
+class StateLog:
+    """Read-only, memory-mapped view of a recorded log."""
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        # A recorder stopped before its first snapshot leaves an empty file, which cannot be mapped
+        if os.fstat(self.file.fileno()).st_size < FILE_HEADER.size:
+            self.file.close()
+            raise ValueError(f"{path} is not a version {VERSION} state log")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, layout_size = FILE_HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} state log")
+        self.layout = RecordLayout.from_json(self.map[FILE_HEADER.size:FILE_HEADER.size + layout_size])
+        self.start = FILE_HEADER.size + layout_size
+        self.record_size = self.layout.record.size
+        # A record cut short by a crash while recording is ignored
+        self.count = (len(self.map) - self.start) // self.record_size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return self.layout.unpack(self.map, self.start + index * self.record_size)
+
+    def timestamp(self, index):
+        """Timestamp of a record, read without unpacking the rest of it."""
+        return _untime(struct.unpack_from("<d", self.map, self.start + index * self.record_size)[0])
+
+    def find(self, timestamp):
+        """Index of the first record at or after `timestamp`, records without a timestamp sort first."""
+        keys = _TimestampKeys(self)
+        return min(bisect.bisect_left(keys, timestamp), self.count - 1)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+class _TimestampKeys:
+    """Sequence of record timestamps for bisect, read on demand from the map."""
+    def __init__(self, log):
+        self.log = log
+
+    def __len__(self):
+        return len(self.log)
+
+    def __getitem__(self, index):
+        timestamp = self.log.timestamp(index)
+        return -math.inf if timestamp is None else timestamp
+
+
+class ReplayServer:
+    """
+    Publishes the snapshots of a StateLog through a socket interface, as the
+    camera would, at `speed` times the recorded pace. seek() jumps to a time
+    in the recording; pause() and resume() hold and continue the replay.
+    """
+    def __init__(self, log, socket_interface, speed=1.0, loop=False):
+        self.log = log
+        self.socket_interface = socket_interface
+        self.speed = speed
+        self.loop = loop
+        self.running = True
+        self.paused = False
+        self.position = 0
+        self.condition = threading.Condition()
+
+    def seek(self, seconds):
+        """Jump to `seconds` after the first snapshot of the recording."""
+        if not len(self.log):
+            return
+        with self.condition:
+            first = self.log.timestamp(0) or 0.0
+            self.position = self.log.find(first + seconds)
+            self.condition.notify()
+
+    def set_speed(self, speed):
+        with self.condition:
+            self.speed = speed
+            self.condition.notify()
+
+    def pause(self):
+        with self.condition:
+            self.paused = True
+
+    def resume(self):
+        with self.condition:
+            self.paused = False
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def run(self):
+        goal_tags = self.log.layout.goal_tags
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: not self.paused or not self.running)
+                if not self.running:
+                    return
+                if self.position >= len(self.log):
+                    if not self.loop:
+                        return
+                    self.position = 0
+                index = self.position
+                self.position += 1
+
+            self.socket_interface.publish_state(self.log[index], goal_tags)
+
+            if index + 1 < len(self.log):
+                current, following = self.log.timestamp(index), self.log.timestamp(index + 1)
+                if current is not None and following is not None and self.speed > 0:
+                    with self.condition:
+                        # Woken early by seek, speed changes and stop
+                        self.condition.wait(max(0.0, following - current) / self.speed)
+
+
+if __name__ == "__main__":
+    import argparse
+    from socket_server import SocketInterface
+
+    parser = argparse.ArgumentParser(description="Replay a recorded game to players")
+    parser.add_argument("log")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--start", type=float, default=0.0, help="Seconds into the recording")
+    parser.add_argument("--loop", action="store_true")
+    parser.add_argument("--port", type=int, default=65432)
+    args = parser.parse_args()
+
+    class ReplayManager:
+        """Stands in for Manager: commands from players are dropped during a replay."""
+        running = True
+
+        def process_player_data(self, data):
+            pass
+
+    manager = ReplayManager()
+    log = StateLog(args.log)
+    socket_interface = SocketInterface(manager, port=args.port)
+    replay = ReplayServer(log, socket_interface, args.speed, args.loop)
+    replay.seek(args.start)
+
+    threading.Thread(target=socket_interface.run_server, daemon=True).start()
+    replay_thread = threading.Thread(target=replay.run)
+    replay_thread.start()
+    print(f"Replaying {len(log)} snapshots at {args.speed}x. Commands: seek <s>, speed <x>, pause, resume, quit")
+    try:
+        while replay_thread.is_alive():
+            try:
+                command = input().split()
+            except EOFError:
+                # No console, just replay to the end
+                while replay_thread.is_alive():
+                    time.sleep(0.5)
+                break
+            if not command:
+                continue
+            if command[0] == "seek":
+                replay.seek(float(command[1]))
+            elif command[0] == "speed":
+                replay.set_speed(float(command[1]))
+            elif command[0] == "pause":
+                replay.pause()
+            elif command[0] == "resume":
+                replay.resume()
+            elif command[0] == "quit":
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        replay.stop()
+        manager.running = False
+        replay_thread.join(1)
+        log.close()
@@ -0,0 +1,65 @@
+import json
+import socket
+import threading
+from protocol import encode_datagram
+from latency_tracer import tracer
+
+MAX_DATAGRAM_SIZE = 65507
+
+
+class UDPStatePublisher:
+    """
+    Sends the world snapshot as one UDP datagram per frame.
+
+    Every datagram carries a sequence number and the capture timestamp, so
+    clients can throw away packets that arrive late or out of order instead
+    of waiting for them the way TCP does. Datagrams go to every subscribed
+    address, and to `multicast_group` (host, port) when one is configured.
+    """
+    def __init__(self, multicast_group=None, multicast_ttl=1):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.multicast_group = multicast_group
+        if multicast_group:
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, multicast_ttl)
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.seq = 0
+        self.sent = 0
+        self.errors = 0
+
+    def subscribe(self, address):
+        with self.lock:
+            self.subscribers.add(address)
+
+    def unsubscribe(self, address):
+        with self.lock:
+            self.subscribers.discard(address)
+
+    def publish(self, world, goal_tags):
+        """Send one snapshot. The payload includes each player's goal so clients can build their view."""
+        with self.lock:
+            destinations = list(self.subscribers)
+        if self.multicast_group:
+            destinations.append(self.multicast_group)
+        if not destinations:
+            return
+
+        self.seq += 1
+        payload = json.dumps(dict(world, goal_tags=goal_tags)).encode('utf-8')
+        datagram = encode_datagram(self.seq, world.get("timestamp"), payload)
+        if len(datagram) > MAX_DATAGRAM_SIZE:
+            print(f"State datagram of {len(datagram)} bytes is too large for UDP")
+            return
+
+        for address in destinations:
+            try:
+                self.sock.sendto(datagram, address)
+                self.sent += 1
+            except OSError:
+                self.errors += 1
+        tracer.mark(world.get("timestamp"), "state_sent")
+
+    def close(self):
+        self.sock.close()